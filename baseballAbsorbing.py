@@ -0,0 +1,115 @@
+"""
+Exact solver for the baseball MC, treating (state, batter up) as an absorbing Markov chain.
+
+The game is nine copies of the same 24-state half-inning, so the fundamental matrix of a single half-inning (for every
+batter that can be up) is computed once, and the innings are solved backwards from the 9th, each one feeding the
+start-of-inning distributions to the one before it.
+"""
+import numpy as np
+import baseballTelemetry as telemetry
+
+
+def halfInningBlocks(kernels):
+    """
+    Splits the transitions of a lineup into the transitions within a half-inning and the transitions ending it.
+    Local half-inning states are indexed by (24-state base/out ID) * n + (batter up), for a lineup of n batters.
+    :param kernels: [TransitionKernel]. The transition kernels for the batters in the lineup, in order.
+    :return: (numpy array, numpy array). Q, of shape (runs, 24n, 24n), where Q[r] holds the transitions within the
+        half-inning that score r runs, and X, of shape (runs, 24n, n), where X[r][j][b] is the probability of ending
+        the half-inning from local state j with r runs scoring, with batter b due up next.
+    """
+    n = len(kernels)
+    nRuns = max(int(kernel.runs.max()) for kernel in kernels) + 1
+    Q = np.zeros((nRuns, 24 * n, 24 * n))
+    X = np.zeros((nRuns, 24 * n, n))
+    for (batter, kernel) in enumerate(kernels):
+        nextBatter = (batter + 1) % n
+        # All innings behave the same, so only the transitions out of the first one are needed
+        inInning = kernel.source < 24
+        source = kernel.source[inInning] * n + batter
+        target = kernel.target[inInning]
+        runs = kernel.runs[inInning]
+        prob = kernel.prob[inInning]
+        stays = target < 24
+        np.add.at(Q, (runs[stays], source[stays], target[stays] * n + nextBatter), prob[stays])
+        np.add.at(X, (runs[~stays], source[~stays], nextBatter), prob[~stays])
+    return (Q, X)
+
+
+class AbsorbingChain:
+    """
+    Exact run distributions and expected runs of a lineup, from every (state, batter up) pair of the baseball MC.
+    """
+    def __init__(self, lineup, maxRuns=20, model=None):
+        """
+        :param lineup: [Batter]. List containing the 9 batters in the lineup, in order.
+        :param maxRuns: int. The largest number of runs tracked in the run distributions.
+        :param model: EventModel. The event model, or None for the six events of baseballMC.State.
+        """
+        self.lineup = lineup
+        self.maxRuns = maxRuns
+        kernels = list(map(lambda Batter: Batter.transitionKernel(model), lineup))
+        with telemetry.phase('absorbingSolve'):
+            (self.distributions, self.expected) = solveAbsorbingChain(kernels, maxRuns)
+
+    def runDistribution(self, stateID=0, batterUp=0):
+        """
+        :param stateID: int. The stateID of the state the game is in.
+        :param batterUp: int. The position in the lineup of the batter who is up.
+        :return: numpy array. An array containing maxRuns + 1 elements. The i-th element is the probability that the
+            lineup will score exactly i more runs from the given state.
+        """
+        return self.distributions[:, stateID, batterUp]
+
+    def expectedRemainingRuns(self, stateID=0, batterUp=0):
+        """
+        :param stateID: int. The stateID of the state the game is in.
+        :param batterUp: int. The position in the lineup of the batter who is up.
+        :return: float. The expected number of runs the lineup will score from the given state.
+        """
+        return self.expected[stateID, batterUp]
+
+
+def solveAbsorbingChain(kernels, maxRuns=20):
+    """
+    Solves the baseball MC exactly for a lineup.
+    :param kernels: [TransitionKernel]. The transition kernels for the batters in the lineup, in order.
+    :param maxRuns: int. The largest number of runs tracked in the run distributions.
+    :return: (numpy array, numpy array). The run distributions, of shape (maxRuns + 1, 217, n), where [k][s][b] is
+        the probability of scoring exactly k more runs from state s with batter b up, and the expected remaining
+        runs, of shape (217, n). Runs beyond maxRuns are not part of the distributions, but are part of the
+        expected runs.
+    """
+    n = len(kernels)
+    (Q, X) = halfInningBlocks(kernels)
+    size = 24 * n
+    # Transitions that score no runs can never loop back to the same state, so I - Q[0] is invertible
+    fundamental = np.linalg.inv(np.eye(size) - Q[0])
+    fundamentalAll = np.linalg.inv(np.eye(size) - Q.sum(axis=0))
+    runs = np.arange(Q.shape[0])
+    rewards = runs @ Q.sum(axis=2) + runs @ X.sum(axis=2)
+    exits = X.sum(axis=0)
+
+    distributions = np.zeros((maxRuns + 1, 217, n))
+    expected = np.zeros((217, n))
+    distributions[0, 216, :] = 1
+    # The distributions and expected runs from the start of the next inning, for each batter up
+    nextStart = np.zeros((maxRuns + 1, n))
+    nextStart[0] = 1
+    nextExpected = np.zeros(n)
+    for inning in range(9, 0, -1):
+        local = np.zeros((maxRuns + 1, size))
+        for k in range(maxRuns + 1):
+            rhs = np.zeros(size)
+            for r in range(min(k, Q.shape[0] - 1) + 1):
+                if r > 0:
+                    rhs += Q[r] @ local[k - r]
+                rhs += X[r] @ nextStart[k - r]
+            local[k] = fundamental @ rhs
+        localExpected = fundamentalAll @ (rewards + exits @ nextExpected)
+        offset = 24 * (inning - 1)
+        distributions[:, offset:offset + 24, :] = local.reshape(maxRuns + 1, 24, n)
+        expected[offset:offset + 24, :] = localExpected.reshape(24, n)
+        nextStart = local[:, :n]
+        nextExpected = localExpected[:n]
+    return (distributions, expected)
@@ -0,0 +1,163 @@
+"""
+Benchmarks for the hot paths of the simulator, on the TeamData/AL rosters and on synthetic rosters.
+
+Every run measures the wall time, peak memory and number of MC iterations of each benchmark, and fails when a
+benchmark got slower than its median over the last few runs by more than the regression threshold. Passing runs are
+recorded to a JSON history; a failing one only with --accept, so that rerunning a slowdown cannot make it the baseline.
+
+    python baseballBenchmark.py --teams redsox --synthetic 1 --history benchmarkHistory.json --threshold 0.25
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+import baseballSimulator
+from baseballKernel import kernelFromRates
+import baseballTelemetry as telemetry
+from baseballMC import State, getID
+from baseballPlayer import Player
+from baseballTeam import Team, loadData
+
+
+def syntheticTeam(seed, name=None):
+    """
+    Creates a team of 9 batters with random, but realistic, statistics.
+    :param seed: int. The seed of the random numbers.
+    :param name: string. The name of the team.
+    :return: Team. The synthetic team.
+    """
+    rng = np.random.default_rng(seed)
+    batters = []
+    for i in range(9):
+        pa = int(rng.integers(300, 700))
+        # Walk, single, double, triple and home run rates around league averages
+        (bb, b1, b2, b3, b4) = rng.multinomial(pa, [0.095, 0.145, 0.045, 0.005, 0.03, 0.68])[:5]
+        ops = (b1 + 2 * b2 + 3 * b3 + 4 * b4) / (pa - bb) + (b1 + b2 + b3 + b4 + bb) / pa
+        batters.append(Player(i, 'Synthetic ' + str(i), pa, b1, b2, b3, b4, bb, ops))
+    return Team(name or 'synthetic' + str(seed), batters, [])
+
+
+def measure(function, repeats):
+    """
+    Runs a benchmark.
+    :param function: function. The benchmark, called without arguments.
+    :param repeats: int. The number of times it is run. The fastest run is kept.
+    :return: dict. The wall time in seconds and the peak memory in bytes of one run, and its solver telemetry.
+    """
+    seconds = []
+    # The benchmarks are run silently (game prints its result)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(repeats):
+            kernelFromRates.cache_clear()
+            start = time.perf_counter()
+            function()
+            seconds.append(time.perf_counter() - start)
+        kernelFromRates.cache_clear()
+        tracemalloc.start()
+        with telemetry.collect() as metrics:
+            function()
+        (current, peak) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {'seconds': min(seconds), 'peakBytes': peak, 'iterations': metrics.iterations,
+            'iterationCapHits': metrics.iterationCapHits, 'maxTruncatedMass': metrics.maxTruncatedMass,
+            'kernelBuilds': metrics.kernelBuilds}
+
+
+def benchmarks(team, opponent):
+    """
+    :param team: Team. The roster the benchmarks run on.
+    :param opponent: Team. The opponent used for the game benchmark.
+    :return: [(string, function, int)]. The name, function and number of repeats of each benchmark.
+    """
+    lineup = team.batters
+    kernels = lambda: list(map(lambda Batter: Batter.transitionKernel(), lineup))
+    state = State(getID(1, 0, 0, 0, 9))
+    return [
+        ('transitionMatrixSimple', lambda: lineup[0].transitionMatrixSimple(), 20),
+        ('transitionKernel', lambda: lineup[0].transitionKernel(), 50),
+        ('simulateMarkovChain', lambda: baseballSimulator.simulateMarkovChain(kernels()), 10),
+        ('expectedRuns', lambda: baseballSimulator.expectedRuns(lineup), 10),
+        ('expectedRemainingRuns', lambda: baseballSimulator.expectedRemainingRuns(lineup, 1, state), 10),
+        ('formBestLineup', lambda: baseballSimulator.formBestLineup(team), 1),
+        ('game', lambda: baseballSimulator.game(team, opponent), 1),
+    ]
+
+
+def runBenchmarks(teams, only=None):
+    """
+    :param teams: [Team]. The rosters the benchmarks run on.
+    :param only: [string]. The names of the benchmarks to run, or None to run all of them.
+    :return: dict. The measurements of each benchmark, keyed by 'team/benchmark'.
+    """
+    results = {}
+    for (i, team) in enumerate(teams):
+        opponent = teams[(i + 1) % len(teams)]
+        for (name, function, repeats) in benchmarks(team, opponent):
+            if only is None or name in only:
+                results[team.name + '/' + name] = measure(function, repeats)
+    return results
+
+
+def regressions(results, history, threshold, noise=0.001, window=5):
+    """
+    :param results: dict. The measurements of this run.
+    :param history: [dict]. The previous runs, oldest first.
+    :param threshold: float. The largest allowed relative slowdown.
+    :param noise: float. Slowdowns smaller than this many seconds are ignored, as they are within timing noise.
+    :param window: int. The number of previous runs the baseline is taken over.
+    :return: [string]. A description of each benchmark slower than allowed.
+    """
+    failures = []
+    for (name, result) in results.items():
+        previous = [run['results'][name]['seconds'] for run in history[-window:] if name in run['results']]
+        if previous:
+            baseline = float(np.median(previous))
+            if result['seconds'] > baseline * (1 + threshold) + noise:
+                failures.append(name + ': ' + '%.3g' % baseline + 's -> ' + '%.3g' % result['seconds'] + 's')
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the hot paths of the baseball simulator.')
+    parser.add_argument('--teams', nargs='*', default=baseballSimulator.teamsAL, help='TeamData/AL rosters to use.')
+    parser.add_argument('--synthetic', type=int, default=2, help='Number of synthetic rosters to use.')
+    parser.add_argument('--only', nargs='*', default=None, help='Names of the benchmarks to run.')
+    parser.add_argument('--history', default='benchmarkHistory.json', help='Path of the JSON history.')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Largest allowed slowdown relative to the recent runs (0.25 = 25%%).')
+    parser.add_argument('--accept', action='store_true',
+                        help='Record the run in the history even if it has regressions, e.g. for an expected slowdown.')
+    args = parser.parse_args(argv)
+
+    teams = list(map(loadData, args.teams)) + [syntheticTeam(seed) for seed in range(args.synthetic)]
+    results = runBenchmarks(teams, args.only)
+    history = []
+    if os.path.exists(args.history):
+        with open(args.history) as f:
+            history = json.load(f)
+    failures = regressions(results, history, args.threshold)
+    # A regressed run is not recorded unless accepted, so that rerunning a slowdown cannot move the baseline to it
+    if not failures or args.accept:
+        history.append({'time': time.time(), 'results': results})
+        with open(args.history, 'w') as f:
+            json.dump(history, f, indent=2)
+
+    for (name, result) in results.items():
+        print(name + ': ' + '%.3g' % result['seconds'] + 's, ' + str(result['peakBytes']) + ' bytes, '
+              + str(result['iterations']) + ' iterations')
+    if failures:
+        print('\nRegressions above ' + str(100 * args.threshold) + '%:')
+        for failure in failures:
+            print(failure)
+        if not args.accept:
+            print('The run was not recorded in the history (use --accept to record it).')
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
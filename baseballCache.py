@@ -0,0 +1,173 @@
+"""
+Content-addressed cache of lineup run distributions.
+
+Entries are keyed by the ordered rates of the batters in the lineup, so the same lineup is recognised across teams,
+functions and runs. Recently used entries are kept in memory, and every entry is also stored on disk (when a directory
+is given), where the least recently used files are evicted once the store grows past its size limit. The size of the store is
+tracked as entries are written, so the directory is only scanned when the limit is reached (or every scanInterval
+writes, to account for the other processes sharing it), and eviction then frees some headroom below the limit.
+"""
+import hashlib
+import os
+import tempfile
+import time
+from collections import OrderedDict
+import numpy as np
+
+
+class LineupCache:
+    """
+    Two-tier (in-memory LRU and on-disk) cache of run distributions.
+    """
+    def __init__(self, directory=None, memoryEntries=4096, maxDiskBytes=256 * 2**20, scanInterval=1024,
+                 headroom=0.1):
+        """
+        :param directory: string. The directory of the on-disk store, or None to only keep entries in memory.
+        :param memoryEntries: int. The largest number of entries kept in memory.
+        :param maxDiskBytes: int. The largest total size of the on-disk store, in bytes.
+        :param scanInterval: int. The number of writes after which the size of the store is measured again.
+        :param headroom: float. The fraction of maxDiskBytes freed below the limit when evicting.
+        """
+        self.directory = directory
+        self.memoryEntries = memoryEntries
+        self.maxDiskBytes = maxDiskBytes
+        self.scanInterval = scanInterval
+        self.headroom = headroom
+        # The estimated size of the on-disk store, measured by the first write
+        self.diskBytes = None
+        self.writesSinceScan = 0
+        self.memory = OrderedDict()
+        self.memoryHits = 0
+        self.diskHits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(rates, *params):
+        """
+        :param rates: [(float)]. The rates of the batters in the lineup, in order.
+        :param params: Any other values the cached result depends on (e.g. solver settings).
+        :return: string. The key of the lineup.
+        """
+        digest = hashlib.sha256(np.asarray(rates, dtype=np.float64).tobytes())
+        digest.update(repr(params).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        :param key: string. The key of the entry.
+        :return: numpy array. The cached entry, or None if it is not in the cache.
+        """
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.memoryHits += 1
+            return self.memory[key]
+        if self.directory is not None:
+            path = self._path(key)
+            try:
+                value = np.load(path)
+                # Mark the file as recently used, for eviction
+                os.utime(path)
+            except (OSError, ValueError):
+                value = None
+            if value is not None:
+                self.diskHits += 1
+                self._remember(key, value)
+                return value
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """
+        Stores an entry in the cache.
+        :param key: string. The key of the entry.
+        :param value: numpy array. The entry.
+        """
+        self._remember(key, value)
+        if self.directory is not None:
+            # Write to a temporary file first, so concurrent readers never see a partial entry
+            (fd, temporary) = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, value)
+                size = os.path.getsize(temporary)
+                os.replace(temporary, self._path(key))
+            except BaseException:
+                try:
+                    os.remove(temporary)
+                except OSError:
+                    pass
+                raise
+            if self.diskBytes is None:
+                self._evict()
+            else:
+                self.diskBytes += size
+                self.writesSinceScan += 1
+                if self.diskBytes > self.maxDiskBytes or self.writesSinceScan >= self.scanInterval:
+                    self._evict()
+
+    def getOrCompute(self, lineup, compute, *params):
+        """
+        :param lineup: [Batter]. The batters in the lineup, in order.
+        :param compute: function. Computes the entry when it is not in the cache.
+        :param params: Any other values the entry depends on (e.g. solver settings).
+        :return: numpy array. The entry for the lineup.
+        """
+        key = self.key(list(map(lambda Batter: Batter.rates(), lineup)), *params)
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def stats(self):
+        """
+        :return: dict. The number of hits in each tier and of misses.
+        """
+        return {'memoryHits': self.memoryHits, 'diskHits': self.diskHits, 'misses': self.misses}
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    def _remember(self, key, value):
+        # A view would keep the whole array it comes from alive for as long as the entry is cached
+        if value.base is not None:
+            value = value.copy()
+        # Entries are shared by every caller that looks them up, so they must not be modified
+        value.setflags(write=False)
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memoryEntries:
+            self.memory.popitem(last=False)
+
+    def _evict(self, staleSeconds=3600):
+        entries = []
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            if entry.name.endswith('.npy'):
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+            elif entry.name.endswith('.tmp') and now - stat.st_mtime > staleSeconds:
+                # Left behind by a process that died while writing an entry
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+        total = sum(size for (_, size, _) in entries)
+        if total > self.maxDiskBytes:
+            # Remove the least recently used files until the store fits, with some headroom
+            target = self.maxDiskBytes * (1 - self.headroom)
+            for (_, size, path) in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
+        self.diskBytes = total
+        self.writesSinceScan = 0
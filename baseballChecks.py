@@ -0,0 +1,151 @@
+"""
+Equivalence checks between the solvers of the baseball MC, so that refactoring the kernels, the solvers or the event
+compiler cannot silently change their results:
+
+- the sparse kernels hold the same transitions as the dense matrices built from baseballMC.State, and
+  simulateMarkovChain gives the same distribution as simulateMarkovChainDense;
+- the default EventModel compiles to exactly the transition tables of baseballMC.State;
+- the InningEngine gives the same run distributions and expected runs as the AbsorbingChain;
+- the gradients of baseballSensitivity match central finite differences.
+
+    python baseballChecks.py
+"""
+import numpy as np
+from baseballMC import State, eventNames, eventTargets, eventRuns
+from baseballKernel import kernelFromRates
+from baseballEvents import defaultModel
+from baseballAbsorbing import AbsorbingChain
+from baseballInnings import InningEngine
+from baseballWinProbability import gameWinProbability
+from baseballSensitivity import expectedRunsGradient, winProbabilityGradient
+from baseballSimulator import simulateMarkovChain, simulateMarkovChainDense
+
+
+class RatesBatter:
+    """
+    A batter given directly by its rates, to perturb them.
+    """
+    def __init__(self, rates):
+        self.name = 'rates'
+        self._rates = tuple(rates)
+
+    def rates(self):
+        return self._rates
+
+    def transitionKernel(self, model=None):
+        return kernelFromRates(self._rates, model)
+
+
+def denseTransitionMatrix(rates):
+    """
+    Builds a batter's transition matrix one state at a time, from the events of baseballMC.State.
+    :param rates: (float). The probabilities of a walk, single, double, triple, home run and out, in that order.
+    :return: numpy (5, 217, 217) array. The transition matrix, where [r][i][j] is the probability of going from
+        state i to state j with r runs scoring.
+    """
+    p = np.zeros((5, 217, 217))
+    # Once a state with 9 innings and three outs is reached, it never changes again.
+    p[0][216][216] = 1
+    for i in range(216):
+        currState = State(i)
+        for (e, event) in enumerate(eventNames):
+            (nextState, runs) = getattr(currState, event)()
+            p[runs][i][nextState] += rates[e]
+    return p
+
+
+def checkKernels(lineup):
+    """
+    :param lineup: [Batter]. The batters of a lineup.
+    :return: (float, float). The largest difference between the sparse kernels and the dense matrices, and between
+        the distributions of simulateMarkovChain and simulateMarkovChainDense.
+    """
+    dense = list(map(lambda Batter: denseTransitionMatrix(Batter.rates()), lineup))
+    kernels = list(map(lambda Batter: Batter.transitionKernel(), lineup))
+    kernelError = max(np.abs(kernel.toDense() - p).max() for (kernel, p) in zip(kernels, dense))
+    chainError = np.abs(simulateMarkovChain(kernels) - simulateMarkovChainDense(dense)).max()
+    return (kernelError, chainError)
+
+
+def checkEventModel():
+    """
+    :return: bool. Whether the default EventModel compiles to one entry per state and event, with the targets and
+        runs of baseballMC.State and a weight of exactly 1.
+    """
+    (source, target, runs, event, weight) = defaultModel.tables()
+    expected = np.array([(i, e) for e in range(len(eventNames)) for i in range(216)])
+    return bool(len(source) == len(expected) and (source == expected[:, 0]).all() and (event == expected[:, 1]).all()
+                and (target == eventTargets[event, source]).all() and (runs == eventRuns[event, source]).all()
+                and (weight == 1).all())
+
+
+def checkInningEngine(lineup):
+    """
+    :param lineup: [Batter]. The batters of a lineup.
+    :return: (float, float). The largest difference between the run distributions of the InningEngine and the
+        AbsorbingChain, and between their expected runs.
+    """
+    engine = InningEngine(lineup)
+    chain = AbsorbingChain(lineup)
+    return (np.abs(engine.gameDistribution() - chain.runDistribution()).max(),
+            abs(engine.expectedGameRuns() - chain.expectedRemainingRuns()))
+
+
+def checkGradients(homeLineup, awayLineup, h=1e-6):
+    """
+    :param homeLineup: [Batter]. The batters of the home lineup.
+    :param awayLineup: [Batter]. The batters of the away lineup.
+    :param h: float. The step of the finite differences.
+    :return: (float, float). The largest difference between the analytic gradients and central finite differences,
+        for the expected runs of the home lineup, and for the win probability of the home team.
+    """
+    home = list(map(lambda Batter: RatesBatter(Batter.rates()), homeLineup))
+    away = list(map(lambda Batter: RatesBatter(Batter.rates()), awayLineup))
+    def perturbed(lineup, slot, e, step):
+        rates = list(lineup[slot].rates())
+        rates[e] += step
+        return lineup[:slot] + [RatesBatter(rates)] + lineup[slot + 1:]
+    runsGradient = expectedRunsGradient(home)[1]
+    (p, homeGradient, awayGradient) = winProbabilityGradient(home, away)
+    runsError = 0
+    winError = 0
+    for slot in range(len(home)):
+        for e in range(len(eventNames)):
+            (up, down) = (perturbed(home, slot, e, h), perturbed(home, slot, e, -h))
+            runs = (AbsorbingChain(up).expectedRemainingRuns() - AbsorbingChain(down).expectedRemainingRuns()) / (2 * h)
+            runsError = max(runsError, abs(runs - runsGradient[slot, e]))
+            win = (gameWinProbability(InningEngine(up), InningEngine(away))
+                   - gameWinProbability(InningEngine(down), InningEngine(away))) / (2 * h)
+            winError = max(winError, abs(win - homeGradient[slot, e]))
+            (up, down) = (perturbed(away, slot, e, h), perturbed(away, slot, e, -h))
+            win = (gameWinProbability(InningEngine(home), InningEngine(up))
+                   - gameWinProbability(InningEngine(home), InningEngine(down))) / (2 * h)
+            winError = max(winError, abs(win - awayGradient[slot, e]))
+    return (runsError, winError)
+
+
+if __name__ == "__main__":
+    from baseballTeam import loadData
+
+    # Differences due to rounding only, and (for the gradients) to the rounding of the finite differences
+    exact = 1e-12
+    finiteDifferences = 1e-8
+
+    redsox = loadData('redsox').starters()
+    angels = loadData('angels').starters()
+    (kernelError, chainError) = checkKernels(angels)
+    print('Sparse kernels against dense matrices: ' + str(kernelError) + ', simulateMarkovChain against '
+          + 'simulateMarkovChainDense: ' + str(chainError))
+    assert kernelError < exact and chainError < exact
+    print('Default EventModel compiles to the State tables: ' + str(checkEventModel()))
+    assert checkEventModel()
+    for lineup in (redsox, angels):
+        (distributionError, runsError) = checkInningEngine(lineup)
+        print('InningEngine against AbsorbingChain: ' + str(distributionError) + ' (distribution), '
+              + str(runsError) + ' (expected runs)')
+        assert distributionError < exact and runsError < exact
+    (runsError, winError) = checkGradients(redsox, angels)
+    print('Gradients against finite differences: ' + str(runsError) + ' (expected runs), ' + str(winError)
+          + ' (win probability)')
+    assert runsError < finiteDifferences and winError < finiteDifferences
+    print('All checks passed.')
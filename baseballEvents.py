@@ -0,0 +1,210 @@
+"""
+Declarative event models for the baseball MC, compiled into the transition tables the solvers consume.
+
+An EventModel lists the plate appearance events (whose probabilities are the batter's rates, in order) and the events
+that can happen before each plate appearance (stolen bases, caught stealing, ...). Each event is a list of outcomes:
+an outcome applies in some states, happens with a fixed probability when it does, and moves the runners. The first
+outcome of an event is its default, and gets the probability left over by the others.
+
+compileModel turns a model into flat (source, target, runs, event, weight) tables, with the events before the plate
+appearance composed into it, so that a richer model is still a single sparse kernel per batter:
+
+    model = EventModel(defaultEvents(doublePlay=0.12, sacrificeFly=0.25, firstToThird=0.3),
+                       [stolenBaseEvent(attempt=0.08, success=0.72)])
+    chain = AbsorbingChain(lineup, model=model)
+
+The default model holds the six events of baseballMC.State, and compiles to exactly the same transitions.
+"""
+import numpy as np
+from baseballMC import State, getID, eventNames
+
+
+class Outcome:
+    """
+    One way an event can play out.
+    """
+    def __init__(self, name, advance, probability=None, applies=None):
+        """
+        :param name: string. The name of the outcome.
+        :param advance: function. Called as advance(state) for a State, returns the (stateID, runs) pair the outcome
+            leads to, e.g. from advanceRunners.
+        :param probability: float. The probability of the outcome in the states where it applies, or None for the
+            default outcome of an event.
+        :param applies: function. Called as applies(state) for a State, returns whether the outcome can happen in
+            that state (always, by default).
+        """
+        self.name = name
+        self.advance = advance
+        self.probability = probability
+        self.applies = applies if applies is not None else lambda state: True
+
+
+class Event:
+    """
+    An event of the baseball MC, as a list of outcomes.
+    """
+    def __init__(self, name, outcomes):
+        """
+        :param name: string. The name of the event.
+        :param outcomes: [Outcome]. The outcomes of the event. The first one is the default outcome, which happens
+            with the probability left over by the others that apply (for an event before the plate appearance, it
+            should leave the state unchanged).
+        """
+        self.name = name
+        self.outcomes = outcomes
+
+
+class EventModel:
+    """
+    The events of the baseball MC. Models are compiled once, and their kernels are memoized like the default ones.
+    """
+    def __init__(self, events, preEvents=()):
+        """
+        :param events: [Event]. The plate appearance events, in the order of the batters' rates.
+        :param preEvents: [Event]. The events happening before each plate appearance, in order. Their outcomes cannot
+            end the half-inning: every half-inning must end on a plate appearance.
+        """
+        self.events = list(events)
+        self.preEvents = list(preEvents)
+        self._compiled = None
+
+    def tables(self):
+        """
+        :return: (numpy array, numpy array, numpy array, numpy array, numpy array). The compiled model, see
+            compileModel.
+        """
+        if self._compiled is None:
+            self._compiled = compileModel(self)
+        return self._compiled
+
+
+def advanceRunners(state, first, second, third, outs, runs):
+    """
+    :param state: State. The state the outcome happens in.
+    :param first: int. Whether there is a runner on first base after the outcome (1) or not (0).
+    :param second: int. Whether there is a runner on second base after the outcome (1) or not (0).
+    :param third: int. Whether there is a runner on third base after the outcome (1) or not (0).
+    :param outs: int. The number of outs after the outcome. Three or more end the half-inning.
+    :param runs: int. The number of runs scored by the outcome.
+    :return: (int, int). The stateID of the new state and the number of runs scored.
+    """
+    if outs >= 3:
+        return (getID(0, 0, 0, 0, state.i + 1), runs)
+    return (getID(first, second, third, outs, state.i), runs)
+
+
+def outcomeDistribution(event, state):
+    """
+    :param event: Event. The event.
+    :param state: State. The state it happens in.
+    :return: [(int, int, float)]. The stateID, runs scored and probability of each outcome of the event that can
+        happen in the state.
+    """
+    (default, others) = (event.outcomes[0], event.outcomes[1:])
+    branches = [outcome.advance(state) + (outcome.probability,) for outcome in others if outcome.applies(state)]
+    left = 1 - sum(branch[2] for branch in branches)
+    if left < -1e-12:
+        raise ValueError('The outcomes of ' + event.name + ' have a total probability above 1 in state '
+                         + str(state.id) + '.')
+    if left > 0:
+        branches.insert(0, default.advance(state) + (left,))
+    return branches
+
+
+def compileModel(model):
+    """
+    Compiles an event model into transition tables. The events before the plate appearance are composed into it, so
+    every entry is one step of the MC: the probability of entry j for a batter with rates p is p[event[j]] * weight[j].
+    :param model: EventModel. The model.
+    :return: (numpy array, numpy array, numpy array, numpy array, numpy array). The source stateID, target stateID,
+        runs scored, plate appearance event and weight of each entry, for every non-absorbing source state.
+    """
+    entries = []
+    for (e, event) in enumerate(model.events):
+        for i in range(216):
+            # The distribution of (state, runs) just before the plate appearance
+            before = [(i, 0, 1.0)]
+            for preEvent in model.preEvents:
+                after = []
+                for (stateID, runs, weight) in before:
+                    for (target, scored, probability) in outcomeDistribution(preEvent, State(stateID)):
+                        if target // 24 != stateID // 24:
+                            raise ValueError('Outcomes of ' + preEvent.name + ' cannot end the half-inning.')
+                        after.append((target, runs + scored, weight * probability))
+                before = after
+            for (stateID, runs, weight) in before:
+                for (target, scored, probability) in outcomeDistribution(event, State(stateID)):
+                    entries.append((i, target, runs + scored, e, weight * probability))
+    (source, target, runs, event, weight) = zip(*entries)
+    return (np.array(source, dtype=np.intp), np.array(target, dtype=np.intp), np.array(runs, dtype=np.intp),
+            np.array(event, dtype=np.intp), np.array(weight, dtype=np.float64))
+
+
+def _onFirst(state):
+    return state.f == 1 and state.o < 2
+
+
+def _onThird(state):
+    return state.t == 1 and state.o < 2
+
+
+def defaultEvents(doublePlay=0, sacrificeFly=0, firstToThird=0):
+    """
+    The six plate appearance events of baseballMC.State, optionally with extra outcomes for the in-play events.
+    :param doublePlay: float. The probability that an out with a runner on first and fewer than two outs is a double
+        play, retiring the batter and the runner on first (the other runners hold).
+    :param sacrificeFly: float. The probability that an out with a runner on third and fewer than two outs is a
+        sacrifice fly, scoring the runner on third (the other runners hold).
+    :param firstToThird: float. The probability that a runner on first takes third on a single, the runner on second
+        (if any) scoring.
+    :return: [Event]. The events, in the order of eventNames.
+    """
+    events = [Event(name, [Outcome(name, getattr(State, name))]) for name in eventNames]
+    if doublePlay:
+        events[5].outcomes.append(Outcome(
+            'doublePlay', lambda s: advanceRunners(s, 0, s.s, s.t, s.o + 2, 0), doublePlay, _onFirst))
+    if sacrificeFly:
+        events[5].outcomes.append(Outcome(
+            'sacrificeFly', lambda s: advanceRunners(s, s.f, s.s, 0, s.o + 1, 1), sacrificeFly, _onThird))
+    if firstToThird:
+        events[1].outcomes.append(Outcome(
+            'firstToThird', lambda s: advanceRunners(s, 1, 0, 1, s.o, s.s + s.t), firstToThird,
+            lambda s: s.f == 1))
+    return events
+
+
+def stolenBaseEvent(attempt, success):
+    """
+    Steal attempts of second base, before the plate appearance, with a runner on first, second base open and fewer
+    than two outs (a runner caught with two outs would end the half-inning between plate appearances).
+    :param attempt: float. The probability that the runner attempts a steal.
+    :param success: float. The probability that an attempt succeeds.
+    :return: Event. The steal attempts.
+    """
+    applies = lambda s: s.f == 1 and s.s == 0 and s.o < 2
+    return Event('stolenBase', [
+        Outcome('noAttempt', lambda s: (s.id, 0)),
+        Outcome('stolenBase', lambda s: advanceRunners(s, 0, 1, s.t, s.o, 0), attempt * success, applies),
+        Outcome('caughtStealing', lambda s: advanceRunners(s, 0, 0, s.t, s.o + 1, 0), attempt * (1 - success),
+                applies),
+    ])
+
+
+# The six events of baseballMC.State, with no extra outcomes
+defaultModel = EventModel(defaultEvents())
+
+
+if __name__ == "__main__":
+    from baseballTeam import loadData
+    from baseballSimulator import formBestLineup
+    from baseballAbsorbing import AbsorbingChain
+
+    angels = formBestLineup(loadData('angels'))
+    models = [
+        ('Default model', defaultModel),
+        ('Double plays and sacrifice flies', EventModel(defaultEvents(doublePlay=0.12, sacrificeFly=0.25))),
+        ('Aggressive baserunning', EventModel(defaultEvents(doublePlay=0.12, sacrificeFly=0.25, firstToThird=0.3),
+                                              [stolenBaseEvent(attempt=0.08, success=0.72)])),
+    ]
+    for (name, model) in models:
+        print(name + ': ' + str(AbsorbingChain(angels, model=model).expectedRemainingRuns()) + ' expected runs')
@@ -0,0 +1,89 @@
+"""
+Inning-decomposed engine for the baseball MC.
+
+The 217-state MC is nine copies of the same 24-state half-inning, where only the batter leading off changes. The
+half-inning is solved once for each leadoff slot, giving the joint distribution of (runs scored, next leadoff slot),
+and full games are obtained by chaining nine innings together.
+"""
+import numpy as np
+from baseballAbsorbing import halfInningBlocks
+import baseballTelemetry as telemetry
+
+
+def solveHalfInnings(kernels, maxRuns=20):
+    """
+    Solves the half-inning for each batter of the lineup leading off.
+    :param kernels: [TransitionKernel]. The transition kernels for the batters in the lineup, in order.
+    :param maxRuns: int. The largest number of runs tracked in a half-inning.
+    :return: (numpy array, numpy array, numpy array). The joint distributions, of shape (n, maxRuns + 1, n), where
+        [l][r][c] is the probability that the half-inning led off by batter l scores exactly r runs and ends with
+        batter c due up next, the expected runs of the half-inning led off by each batter, and the (n, n) matrix of
+        probabilities that batter c leads off the next inning after one led off by batter l. The last two include
+        half-innings with more than maxRuns runs.
+    """
+    n = len(kernels)
+    (Q, X) = halfInningBlocks(kernels)
+    size = 24 * n
+    fundamental = np.linalg.inv(np.eye(size) - Q[0])
+    # local[k][j][c]: the probability of scoring exactly k runs from local state j, with batter c due up next
+    local = np.zeros((maxRuns + 1, size, n))
+    for k in range(maxRuns + 1):
+        rhs = X[k].copy() if k < Q.shape[0] else np.zeros((size, n))
+        for r in range(1, min(k, Q.shape[0] - 1) + 1):
+            rhs += Q[r] @ local[k - r]
+        local[k] = fundamental @ rhs
+    runs = np.arange(Q.shape[0])
+    rewards = runs @ Q.sum(axis=2) + runs @ X.sum(axis=2)
+    solution = np.linalg.solve(np.eye(size) - Q.sum(axis=0), np.column_stack((rewards, X.sum(axis=0))))
+    # The half-inning starts with the bases empty and no outs, which are the first n local states
+    return (local[:, :n, :].transpose(1, 0, 2), solution[:n, 0], solution[:n, 1:])
+
+
+class InningEngine:
+    """
+    Run distributions of a lineup, built from the half-inning distributions for each leadoff slot.
+    """
+    def __init__(self, lineup, maxRuns=20, model=None):
+        """
+        :param lineup: [Batter]. List containing the 9 batters in the lineup, in order.
+        :param maxRuns: int. The largest number of runs tracked in the run distributions.
+        :param model: EventModel. The event model, or None for the six events of baseballMC.State.
+        """
+        self.lineup = lineup
+        self.maxRuns = maxRuns
+        kernels = list(map(lambda Batter: Batter.transitionKernel(model), lineup))
+        # nextLeadoff[l][c]: the probability that batter c leads off the inning after one led off by batter l
+        with telemetry.phase('inningSolve'):
+            (self.innings, self.inningExpected, self.nextLeadoff) = solveHalfInnings(kernels, maxRuns)
+
+    def gameDistribution(self, innings=9, leadoff=0):
+        """
+        Chains half-innings together to find the run distribution of a game.
+        :param innings: int. The number of innings played.
+        :param leadoff: int. The position in the lineup of the batter leading off the first inning.
+        :return: numpy array. An array containing maxRuns + 1 elements. The i-th element is the probability
+            that the lineup will score i runs.
+        """
+        # u[k][l]: the probability of having scored k runs, with batter l leading off the next inning
+        u = np.zeros((self.maxRuns + 1, len(self.lineup)))
+        u[0][leadoff] = 1
+        for i in range(innings):
+            nextU = np.zeros(u.shape)
+            for r in range(self.maxRuns + 1):
+                nextU[r:] += u[:self.maxRuns + 1 - r] @ self.innings[:, r, :]
+            u = nextU
+        return u.sum(axis=1)
+
+    def expectedGameRuns(self, innings=9, leadoff=0):
+        """
+        :param innings: int. The number of innings played.
+        :param leadoff: int. The position in the lineup of the batter leading off the first inning.
+        :return: float. The expected number of runs the lineup will score (runs beyond maxRuns included).
+        """
+        d = np.zeros(len(self.lineup))
+        d[leadoff] = 1
+        expRuns = 0
+        for i in range(innings):
+            expRuns += d @ self.inningExpected
+            d = d @ self.nextLeadoff
+        return expRuns
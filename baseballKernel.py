@@ -0,0 +1,141 @@
+"""
+Sparse representation of a batter's transition matrix in the baseball MC.
+
+Every row of the dense (5, 217, 217) matrix built by Player.transitionMatrixSimple has at most six non-zero
+entries (one per plate appearance outcome), so a player's transitions are stored as flat arrays of
+(source, target, runs, probability) entries instead.
+"""
+from functools import lru_cache
+import numpy as np
+from baseballEvents import defaultModel
+import baseballTelemetry as telemetry
+
+
+class TransitionKernel:
+    """
+    Represents the transitions of the baseball MC when a given batter is up, as a list of entries
+    (source state, target state, runs scored, probability).
+    """
+    def __init__(self, source, target, runs, prob):
+        """
+        :param source: numpy int array. The stateID each entry starts from.
+        :param target: numpy int array. The stateID each entry leads to.
+        :param runs: numpy int array. The number of runs scored by each entry's transition.
+        :param prob: numpy float array. The probability of each entry's transition.
+        """
+        self.source = np.asarray(source, dtype=np.intp)
+        self.target = np.asarray(target, dtype=np.intp)
+        self.runs = np.asarray(runs, dtype=np.intp)
+        self.prob = np.asarray(prob, dtype=np.float64)
+        # Kernels are shared between players with the same rates, so they must not be modified
+        for array in (self.source, self.target, self.runs, self.prob):
+            array.setflags(write=False)
+        # Flattened propagation arrays, computed lazily for each maximum number of runs and dtype
+        self._expanded = {}
+
+    def expand(self, maxRuns=20, dtype=np.float64):
+        """
+        Expands the entries over every number of runs already scored, so that one step of the MC on a flattened
+        (maxRuns + 1, 217) distribution is a single gather and segmented sum. The entries are sorted by flat target,
+        and transitions that would lead to more than maxRuns runs all go to one extra overflow target, at index
+        (maxRuns + 1) * 217.
+        :param maxRuns: int. The largest number of runs tracked.
+        :param dtype: numpy dtype. The floating point type of the distributions.
+        :return: (numpy array, numpy array, numpy array, numpy array). The flat source index and weight of each entry,
+            the index of the first entry of each target and the flat index of each target. They are shared by every
+            user of the kernel, and read-only.
+        """
+        key = (maxRuns, np.dtype(dtype))
+        if key not in self._expanded:
+            scored = np.arange(maxRuns + 1)[:, None]
+            gather = (scored * 217 + self.source).ravel()
+            scatter = np.minimum((scored + self.runs) * 217 + self.target, (maxRuns + 1) * 217).ravel()
+            weight = np.broadcast_to(self.prob, (maxRuns + 1, len(self.prob))).ravel()
+            order = np.argsort(scatter, kind='stable')
+            scatter = scatter[order]
+            starts = np.flatnonzero(np.diff(scatter, prepend=-1))
+            expanded = (gather[order], weight[order].astype(dtype), starts, scatter[starts])
+            for array in expanded:
+                array.setflags(write=False)
+            self._expanded[key] = expanded
+        return self._expanded[key]
+
+    def toDense(self):
+        """
+        :return: numpy (5, 217, 217) array. The dense transition matrix described by this kernel.
+        """
+        p = np.zeros((5, 217, 217))
+        np.add.at(p, (self.runs, self.source, self.target), self.prob)
+        return p
+
+
+@lru_cache(maxsize=4096)
+def kernelFromRates(rates, model=None):
+    """
+    Builds the transition kernel of a batter from the probability of each plate appearance event. Kernels are
+    memoized, so a batter with the same rates is only ever built once (for each event model).
+    :param rates: (float). The probabilities of a walk, single, double, triple, home run and out, in that order.
+    :param model: EventModel. The event model, or None for the six events of baseballMC.State.
+    :return: TransitionKernel. The transitions for a batter with the given rates.
+    """
+    for metrics in telemetry.active():
+        metrics.onKernelBuild()
+    (source, target, runs, event, weight) = (model or defaultModel).tables()
+    # Once a state with 9 innings and three outs is reached, it never changes again.
+    source = np.concatenate(([216], source))
+    target = np.concatenate(([216], target))
+    runs = np.concatenate(([0], runs))
+    prob = np.concatenate(([1], np.asarray(rates, dtype=np.float64)[event] * weight))
+    return TransitionKernel(source, target, runs, prob)
+
+
+def workBuffers(kernels, maxRuns=20, dtype=np.float64):
+    """
+    Allocates the work buffers of propagateInto, large enough for every kernel given. They belong to the caller, so
+    that kernels can be shared between threads.
+    :param kernels: [TransitionKernel]. The kernels the buffers are used with.
+    :param maxRuns: int. The largest number of runs tracked.
+    :param dtype: numpy dtype. The floating point type of the distributions.
+    :return: (numpy array, numpy array). A buffer with one value per entry, and one with one value per target.
+    """
+    expanded = [kernel.expand(maxRuns, dtype) for kernel in kernels]
+    entries = max(len(gather) for (gather, weight, starts, targets) in expanded)
+    targets = max(len(starts) for (gather, weight, starts, targets) in expanded)
+    return (np.empty(entries, dtype=dtype), np.empty(targets, dtype=dtype))
+
+
+def propagateInto(u, out, kernel, buffers=None):
+    """
+    Advances the distribution of the baseball MC by one plate appearance, without allocating any memory when work
+    buffers are given.
+    :param u: numpy flat array, of length (maxRuns + 1) * 217 (or more). The probability of each (runs, state) pair,
+        where the pair (i, s) is at index i * 217 + s.
+    :param out: numpy flat array, of length (maxRuns + 1) * 217 + 1, of the same dtype as u. Receives the
+        distribution after the plate appearance, followed by the probability newly dropped for scoring more than
+        maxRuns runs.
+    :param kernel: TransitionKernel. The transitions for the batter who is up.
+    :param buffers: (numpy array, numpy array). Work buffers from workBuffers, or None to allocate them.
+    :return: float. The probability newly dropped for scoring more than maxRuns runs.
+    """
+    maxRuns = (len(out) - 1) // 217 - 1
+    (gather, weight, starts, targets) = kernel.expand(maxRuns, out.dtype)
+    (values, sums) = buffers if buffers is not None else workBuffers([kernel], maxRuns, out.dtype)
+    (values, sums) = (values[:len(gather)], sums[:len(starts)])
+    np.take(u, gather, out=values)
+    np.multiply(values, weight, out=values)
+    np.add.reduceat(values, starts, out=sums)
+    out.fill(0)
+    out[targets] = sums
+    return out[-1]
+
+
+def propagate(u, kernel):
+    """
+    Advances the distribution of the baseball MC by one plate appearance.
+    :param u: numpy (maxRuns + 1, 217) array. The i-th row holds the probability of each state with i runs scored.
+    :param kernel: TransitionKernel. The transitions for the batter who is up.
+    :return: numpy (maxRuns + 1, 217) array. The distribution after the plate appearance.
+    """
+    out = np.zeros(u.size + 1, dtype=u.dtype)
+    propagateInto(u.ravel(), out, kernel)
+    return out[:-1].reshape(u.shape)
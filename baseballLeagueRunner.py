@@ -0,0 +1,116 @@
+"""
+Runs Applications 1 and 2 (expected run distributions and best/worst lineups) over a whole league, fanning the teams
+out over a process pool, and writes the results as a JSON report.
+
+    python baseballLeagueRunner.py --directory TeamData/AL --workers 8 --output report.json --cache-dir .lineupCache
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from baseballTeam import loadData
+from baseballCache import LineupCache
+import baseballTelemetry as telemetry
+from baseballSimulator import teamsAL, runsPerGame, expectedRuns, formBestLineup, formWorstLineup
+
+
+def lineupReport(team, which, cache=None):
+    """
+    Finds the best or worst lineup of a team and its expected run distribution.
+    :param team: Team. The team.
+    :param which: string. Which lineup to form, 'best' or 'worst'.
+    :param cache: LineupCache. A cache of run distributions for the candidate lineups, or None.
+    :return: dict. The lineup, its run distribution, its expected number of runs and the solver telemetry.
+    """
+    with telemetry.collect() as metrics:
+        with telemetry.phase(which + 'Lineup'):
+            lineup = formBestLineup(team, cache) if which == 'best' else formWorstLineup(team, cache)
+        u = expectedRuns(lineup, cache)
+    return {
+        'lineup': list(map(lambda Batter: Batter.name, lineup)),
+        'distribution': u.tolist(),
+        'expectedRuns': float(np.arange(len(u)) @ u),
+        'metrics': metrics.toDict(),
+    }
+
+
+def analyseLineup(task):
+    """
+    Finds the best or worst lineup of a team and its expected run distribution.
+    :param task: (string, string, string, string). The team name, the directory containing its csv file, which lineup
+        to form ('best' or 'worst'), and the directory of the lineup cache (or None).
+    :return: dict. The lineup, its run distribution, its expected number of runs, the cache statistics and the
+        solver telemetry.
+    """
+    (teamName, directory, which, cacheDirectory) = task
+    cache = LineupCache(cacheDirectory)
+    result = lineupReport(loadData(teamName, directory), which, cache)
+    result['cache'] = cache.stats()
+    return result
+
+
+def runLeague(teams, directory='TeamData/AL/', workers=None, cacheDirectory=None):
+    """
+    Computes the best and worst lineups of every team, in parallel.
+    :param teams: [string]. The names of the teams' csv files.
+    :param directory: string. The directory containing the csv files.
+    :param workers: int. The number of worker processes (defaults to the number of CPUs).
+    :param cacheDirectory: string. The directory of the on-disk lineup cache, shared by the workers, or None.
+    :return: dict. The report, with one entry per team in the given order, and league-wide summaries.
+    """
+    tasks = [(team, directory, which, cacheDirectory) for team in teams for which in ('best', 'worst')]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map returns the results in the order of the tasks, whatever order they complete in
+        results = list(executor.map(analyseLineup, tasks))
+    report = {'teams': [], 'cache': {'memoryHits': 0, 'diskHits': 0, 'misses': 0}}
+    metrics = telemetry.SolverMetrics()
+    for result in results:
+        for (counter, count) in result.pop('cache').items():
+            report['cache'][counter] += count
+        metrics.merge(result['metrics'])
+    report['metrics'] = metrics.toDict()
+    errors = []
+    differences = []
+    for (i, team) in enumerate(teams):
+        best = results[2 * i]
+        worst = results[2 * i + 1]
+        entry = {'team': team, 'best': best, 'worst': worst,
+                 'difference': best['expectedRuns'] - worst['expectedRuns']}
+        differences.append(entry['difference'])
+        if team in teamsAL:
+            entry['runsPerGame'] = runsPerGame[teamsAL.index(team)]
+            entry['error'] = entry['runsPerGame'] - best['expectedRuns']
+            errors.append(entry['error'])
+        report['teams'].append(entry)
+    if errors:
+        report['averageError'] = sum(errors) / len(errors)
+    if differences:
+        report['averageDifference'] = sum(differences) / len(differences)
+        report['maxDifference'] = max(differences)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Computes the best and worst lineups of a league of teams.')
+    parser.add_argument('teams', nargs='*',
+                        help='Names of the teams\' csv files (default: every csv file in the directory).')
+    parser.add_argument('--directory', default='TeamData/AL/', help='Directory containing the csv files.')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes.')
+    parser.add_argument('--cache-dir', default=None, help='Directory of the on-disk lineup cache.')
+    parser.add_argument('--output', default='-', help='Path of the JSON report (default: standard output).')
+    args = parser.parse_args(argv)
+    teams = args.teams
+    if not teams:
+        teams = sorted(os.path.splitext(f)[0] for f in os.listdir(args.directory) if f.endswith('.csv'))
+    report = runLeague(teams, args.directory, args.workers, args.cache_dir)
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2)
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
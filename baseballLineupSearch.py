@@ -0,0 +1,134 @@
+"""
+Exhaustive search for the best and worst batting orders of a team, over all 9! lineups.
+
+A lineup and its cyclic rotations go through the same half-innings, only starting from a different leadoff slot.
+The half-innings are therefore evaluated once per cyclic order (8! of them), for every leadoff slot, with the
+cyclic orders stacked along a batch axis, and the expected runs of all 9 rotations are read off the results.
+"""
+import itertools
+import numpy as np
+from baseballMC import eventTargets, eventRuns
+from baseballInnings import InningEngine
+
+
+def halfInningTables():
+    """
+    Restricts the transition tables to the 24 states of a half-inning.
+    :return: (numpy array, numpy array). A (6 * 24, 25) array, whose row e * 24 + s is the indicator of the state
+        reached when event e happens in state s (column 24 being the end of the half-inning), and the (6 * 24) array of
+        runs scored by each of these transitions.
+    """
+    nEvents = eventTargets.shape[0]
+    transitions = np.zeros((nEvents * 24, 25))
+    transitions[np.arange(nEvents * 24), eventTargets[:, :24].ravel()] = 1
+    return (transitions, eventRuns[:, :24].ravel().astype(np.float64))
+
+
+(inningTransitions, inningRuns) = halfInningTables()
+
+
+def halfInningsBatch(rates, tolerance=1e-12, maxBatters=200):
+    """
+    Evaluates the half-innings of a batch of lineups, for every leadoff slot.
+    :param rates: numpy (B, n, 6) array. The event probabilities of the batters of each lineup, in batting order.
+    :param tolerance: float. The half-innings are followed until less than this probability is left in them.
+    :param maxBatters: int. The largest number of batters a half-inning is followed for.
+    :return: (numpy array, numpy array). The (B, n) expected runs of the half-inning led off by each slot, and the
+        (B, n, n) probabilities that slot c leads off the next inning after one led off by slot l.
+    """
+    (B, n, nEvents) = rates.shape
+    # Rows are (lineup, leadoff) pairs
+    leadoff = np.tile(np.arange(n), B)
+    lineup = np.repeat(np.arange(B), n)
+    mass = np.zeros((B * n, 24))
+    mass[:, 0] = 1
+    expRuns = np.zeros(B * n)
+    nextLeadoff = np.zeros((B * n, n))
+    rows = np.arange(B * n)
+    for k in range(maxBatters):
+        slot = (leadoff + k) % n
+        p = rates[lineup, slot]
+        mixed = (p[:, :, None] * mass[:, None, :]).reshape(B * n, nEvents * 24)
+        expRuns += mixed @ inningRuns
+        reached = mixed @ inningTransitions
+        nextLeadoff[rows, (slot + 1) % n] += reached[:, 24]
+        mass = reached[:, :24]
+        if mass.sum(axis=1).max() < tolerance:
+            break
+    return (expRuns.reshape(B, n), nextLeadoff.reshape(B, n, n))
+
+
+def rotationExpectedRuns(inningExpected, nextLeadoff, innings=9):
+    """
+    :param inningExpected: numpy (B, n) array. The expected runs of the half-inning led off by each slot.
+    :param nextLeadoff: numpy (B, n, n) array. The probabilities that slot c leads off after slot l.
+    :param innings: int. The number of innings played.
+    :return: numpy (B, n) array. The expected runs of a game where slot l leads off the first inning.
+    """
+    (B, n) = inningExpected.shape
+    # visits[b][l][c]: the expected number of innings led off by slot c, when slot l leads off the first one
+    visits = np.zeros((B, n, n))
+    power = np.broadcast_to(np.eye(n), (B, n, n))
+    for i in range(innings):
+        visits = visits + power
+        power = power @ nextLeadoff
+    return (visits @ inningExpected[:, :, None])[:, :, 0]
+
+
+def expectedRunsBatch(rates):
+    """
+    :param rates: numpy (B, n, 6) array. The event probabilities of the batters of each lineup, in batting order.
+    :return: numpy array. The B expected runs of the lineups.
+    """
+    (inningExpected, nextLeadoff) = halfInningsBatch(rates)
+    return rotationExpectedRuns(inningExpected, nextLeadoff)[:, 0]
+
+
+def exhaustiveLineups(team, chunkSize=2048):
+    """
+    Finds the true best and worst batting orders of a team, by evaluating all of them.
+    :param team: Team. The team for which the lineups are needed. Must contain at least 9 batters; the 9 with the
+        best ops are used.
+    :param chunkSize: int. The number of cyclic orders evaluated together.
+    :return: (([Batter], float), ([Batter], float)). The best lineup and its expected runs, and the worst lineup and
+        its expected runs.
+    """
+    batters = team.starters()
+    n = len(batters)
+    rates = np.array(list(map(lambda Batter: Batter.rates(), batters)))
+    # Every cyclic order has exactly one rotation with the first batter leading off
+    cycles = itertools.permutations(range(1, n))
+    best = (-np.inf, None)
+    worst = (np.inf, None)
+    while True:
+        chunk = np.array(list(itertools.islice(cycles, chunkSize)), dtype=np.intp).reshape(-1, n - 1)
+        if len(chunk) == 0:
+            break
+        orders = np.column_stack((np.zeros(len(chunk), dtype=np.intp), chunk))
+        runs = rotationExpectedRuns(*halfInningsBatch(rates[orders]))
+        (c, r) = np.unravel_index(runs.argmax(), runs.shape)
+        if runs[c, r] > best[0]:
+            best = (runs[c, r], np.roll(orders[c], -r))
+        (c, r) = np.unravel_index(runs.argmin(), runs.shape)
+        if runs[c, r] < worst[0]:
+            worst = (runs[c, r], np.roll(orders[c], -r))
+    bestLineup = list(map(lambda i: batters[i], best[1]))
+    worstLineup = list(map(lambda i: batters[i], worst[1]))
+    return ((bestLineup, best[0]), (worstLineup, worst[0]))
+
+
+if __name__ == "__main__":
+    from baseballTeam import loadData
+    from baseballSimulator import teamsAL, formBestLineup, formWorstLineup
+
+    # Comparing the greedy lineups to the true best and worst lineups, for all teams in the american league
+    for teamName in teamsAL:
+        team = loadData(teamName)
+        ((bestLineup, bestRuns), (worstLineup, worstRuns)) = exhaustiveLineups(team)
+        greedyBest = InningEngine(formBestLineup(team)).expectedGameRuns()
+        greedyWorst = InningEngine(formWorstLineup(team)).expectedGameRuns()
+        print('\nTeam: ' + teamName)
+        print('Best lineup: ' + str(list(map(lambda Batter: Batter.name, bestLineup))))
+        print('Best expected runs: ' + str(bestRuns) + ', greedy: ' + str(greedyBest))
+        print('Worst lineup: ' + str(list(map(lambda Batter: Batter.name, worstLineup))))
+        print('Worst expected runs: ' + str(worstRuns) + ', greedy: ' + str(greedyWorst))
@@ -2,6 +2,7 @@
 Contains all classes and methods that define the states of a Baseball game as states
 in a Markov Chain.
 """
+import numpy as np
 
 def getID(first, second, third, outs, inning):
     """
@@ -101,4 +102,29 @@ class State:
             # Tranistion to next inning
             return (getID(0, 0, 0, 0, self.i + 1), 0)
         else:
-            return (getID(self.f, self.s, self.t, self.o + 1, self.i), 0)
\ No newline at end of file
+            return (getID(self.f, self.s, self.t, self.o + 1, self.i), 0)
+
+
+# The plate appearance outcomes, in the order used by the transition tables and the players' rates.
+eventNames = ('walk', 'single', 'double', 'triple', 'homeRun', 'out')
+
+
+def transitionTables():
+    """
+    Computes the outcome of every plate appearance event from every non-absorbing state.
+    :returns: (numpy array, numpy array). Two (6, 216) arrays, holding the stateID of the new state and the number of
+        runs scored when event e happens in state s, for the events in eventNames.
+    """
+    targets = np.zeros((len(eventNames), 216), dtype=np.intp)
+    runs = np.zeros((len(eventNames), 216), dtype=np.intp)
+    for i in range(216):
+        currState = State(i)
+        for (e, event) in enumerate(eventNames):
+            (targets[e][i], runs[e][i]) = getattr(currState, event)()
+    return (targets, runs)
+
+
+# Computed once, as the transitions only depend on the state and the event.
+(eventTargets, eventRuns) = transitionTables()
+eventTargets.setflags(write=False)
+eventRuns.setflags(write=False)
@@ -0,0 +1,125 @@
+"""
+Vectorized Monte Carlo simulation of baseball games, to cross-check the run distributions of the baseball MC.
+
+Games are played in parallel as numpy arrays of (stateID, batter up, runs), using the same transition tables as the
+baseballMC.State methods. The random streams are seeded from a numpy SeedSequence, so that they can be split across
+processes while staying reproducible.
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from baseballMC import eventTargets, eventRuns
+
+
+def simulateGames(rates, nGames, seed=None):
+    """
+    Plays full games of a lineup.
+    :param rates: numpy (9, 6) array. The event probabilities of the batters in the lineup, in order.
+    :param nGames: int. The number of games played.
+    :param seed: int or numpy SeedSequence. The seed of the random stream.
+    :return: numpy int array. The number of runs scored in each game, with no upper limit.
+    """
+    rng = np.random.default_rng(seed)
+    rates = np.asarray(rates)
+    cumulative = np.cumsum(rates, axis=1)
+    lastEvent = rates.shape[1] - 1
+    runs = np.zeros(nGames, dtype=np.int64)
+    # Only the games still being played are kept in the arrays
+    games = np.arange(nGames)
+    state = np.zeros(nGames, dtype=np.intp)
+    batter = np.zeros(nGames, dtype=np.intp)
+    scored = np.zeros(nGames, dtype=np.int64)
+    while len(games) > 0:
+        u = rng.random(len(games))
+        event = np.minimum((u[:, None] >= cumulative[batter]).sum(axis=1), lastEvent)
+        scored += eventRuns[event, state]
+        state = eventTargets[event, state]
+        batter = (batter + 1) % rates.shape[0]
+        over = state == 216
+        runs[games[over]] = scored[over]
+        playing = ~over
+        games = games[playing]
+        state = state[playing]
+        batter = batter[playing]
+        scored = scored[playing]
+    return runs
+
+
+def _simulateChunk(task):
+    (rates, nGames, seed) = task
+    return simulateGames(rates, nGames, seed)
+
+
+def simulateGamesParallel(rates, nGames, seed=None, workers=1, chunkSize=500000):
+    """
+    Plays full games of a lineup, split in chunks over a process pool. Each chunk gets its own random stream,
+    spawned from the seed, so the results only depend on the seed and the chunk size.
+    :param rates: numpy (9, 6) array. The event probabilities of the batters in the lineup, in order.
+    :param nGames: int. The number of games played.
+    :param seed: int. The seed of the random streams.
+    :param workers: int. The number of worker processes.
+    :param chunkSize: int. The largest number of games played by one task.
+    :return: numpy int array. The number of runs scored in each game.
+    """
+    sizes = [chunkSize] * (nGames // chunkSize)
+    if nGames % chunkSize:
+        sizes.append(nGames % chunkSize)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(rates, size, s) for (size, s) in zip(sizes, seeds)]
+    if workers == 1:
+        chunks = list(map(_simulateChunk, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunks = list(executor.map(_simulateChunk, tasks))
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int64)
+
+
+def crossCheck(lineup, exact, nGames=1000000, seed=None, workers=1):
+    """
+    Compares the exact run distribution of a lineup to simulated games.
+    :param lineup: [Batter]. List containing the 9 batters in the lineup, in order.
+    :param exact: numpy array. The exact run distribution of the lineup, e.g. from expectedRuns.
+    :param nGames: int. The number of games simulated.
+    :param seed: int. The seed of the random streams.
+    :param workers: int. The number of worker processes.
+    :return: dict. The throughput of the simulation, the simulated tail beyond the exact distribution, and the gap
+        between the simulated and exact distributions.
+    """
+    rates = np.array(list(map(lambda Batter: Batter.rates(), lineup)))
+    start = time.time()
+    runs = simulateGamesParallel(rates, nGames, seed, workers)
+    seconds = time.time() - start
+    maxRuns = len(exact) - 1
+    simulated = np.bincount(np.minimum(runs, maxRuns + 1), minlength=maxRuns + 2) / nGames
+    # The standard error of each simulated frequency, under the exact distribution
+    stdErr = np.sqrt(exact * (1 - exact) / nGames)
+    gap = simulated[:maxRuns + 1] - exact
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.where(stdErr > 0, gap / stdErr, 0)
+    return {
+        'games': nGames,
+        'seconds': seconds,
+        'gamesPerSecond': nGames / seconds,
+        'simulatedMean': runs.mean(),
+        # The exact distribution stops at maxRuns, so the means are compared over the same range of scores
+        'simulatedMeanUpToMaxRuns': np.arange(maxRuns + 1) @ simulated[:maxRuns + 1],
+        'exactMeanUpToMaxRuns': np.arange(maxRuns + 1) @ exact,
+        'meanStdErr': runs.std() / np.sqrt(nGames),
+        'tailBeyondMaxRuns': simulated[maxRuns + 1],
+        'exactMissingMass': 1 - exact.sum(),
+        'totalVariation': 0.5 * (np.abs(gap).sum() + abs(simulated[maxRuns + 1] - (1 - exact.sum()))),
+        'maxAbsZ': np.abs(z).max(),
+        'maxRunsSimulated': int(runs.max()),
+    }
+
+
+if __name__ == "__main__":
+    from baseballTeam import loadData
+    from baseballSimulator import formBestLineup
+    from baseballAbsorbing import AbsorbingChain
+
+    redsox = loadData('redsox')
+    lineup = formBestLineup(redsox)
+    report = crossCheck(lineup, AbsorbingChain(lineup).runDistribution(), nGames=1000000, seed=2018)
+    for (name, value) in report.items():
+        print(name + ': ' + str(value))
@@ -0,0 +1,143 @@
+"""
+Resumable batch analysis of many rosters: the expected runs of the best and worst lineups of every team.
+
+Rosters are read lazily, from a directory tree of csv files or from a roster store, and analysed in chunks on a
+process pool, so that only one chunk of rosters is in memory at once. Each result is appended to a JSON lines file as
+soon as it is computed, and the file is synced after every chunk: it is the checkpoint, and an interrupted run started
+again with the same output skips the rosters already in it. Rosters that failed are analysed again, and the checkpoint
+is compacted first, so that the output holds one line per roster.
+
+    python baseballPipeline.py TeamData --output results.jsonl --workers 8 --cache-dir .lineupCache
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from baseballTeam import loadData
+from baseballCache import LineupCache
+from baseballRosterStore import RosterStore
+from baseballLeagueRunner import lineupReport
+
+
+def rosterNames(source):
+    """
+    Lists the rosters of a source lazily.
+    :param source: string. A directory tree of csv files, or a roster store directory.
+    :return: generator of string. The name of each roster, e.g. 'AL/redsox', in a deterministic order.
+    """
+    if os.path.exists(os.path.join(source, 'teams.npy')):
+        yield from RosterStore(source).teamNames()
+        return
+    for (root, dirs, files) in os.walk(source):
+        dirs.sort()
+        for f in sorted(files):
+            if f.endswith('.csv'):
+                yield os.path.splitext(os.path.relpath(os.path.join(root, f), source))[0].replace(os.sep, '/')
+
+
+def analyseRoster(task):
+    """
+    Finds the best and worst lineups of a roster, and their expected run distributions.
+    :param task: (string, string, string). The source of the roster, its name, and the directory of the lineup cache
+        (or None).
+    :return: dict. The name of the roster, the reports of its best and worst lineups and the difference between their
+        expected runs, or the error raised while analysing it.
+    """
+    (source, name, cacheDirectory) = task
+    try:
+        if os.path.exists(os.path.join(source, 'teams.npy')):
+            team = RosterStore(source).team(name)
+        else:
+            team = loadData(name, source)
+        cache = LineupCache(cacheDirectory)
+        best = lineupReport(team, 'best', cache)
+        worst = lineupReport(team, 'worst', cache)
+    except (OSError, ValueError, KeyError) as e:
+        return {'team': name, 'error': repr(e)}
+    return {'team': name, 'best': best, 'worst': worst, 'difference': best['expectedRuns'] - worst['expectedRuns']}
+
+
+def completedRosters(output):
+    """
+    Reads the checkpoint of a previous run, and compacts it: a last line left incomplete by an interruption is dropped,
+    and so are the errors, whose rosters are analysed again, so that every roster has at most one line.
+    :param output: string. The path of the JSON lines output.
+    :return: set. The names of the rosters analysed without error.
+    """
+    if not os.path.exists(output):
+        return set()
+    kept = {}
+    compact = True
+    with open(output, 'rb') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                compact = False
+                break
+            if not line.endswith(b'\n'):
+                compact = False
+                break
+            if 'error' in result or result['team'] in kept:
+                compact = False
+            # The last result of a roster is the one kept
+            kept.pop(result['team'], None)
+            if 'error' not in result:
+                kept[result['team']] = line
+    if not compact:
+        with open(output + '.tmp', 'wb') as f:
+            f.writelines(kept.values())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(output + '.tmp', output)
+    return set(kept)
+
+
+def runPipeline(source, output, workers=None, chunkSize=None, cacheDirectory=None):
+    """
+    Analyses every roster of a source not already in the output, appending the results to the output.
+    :param source: string. A directory tree of csv files, or a roster store directory.
+    :param output: string. The path of the JSON lines output, which is also the checkpoint.
+    :param workers: int. The number of worker processes (defaults to the number of CPUs).
+    :param chunkSize: int. The number of rosters in memory at once (4 per worker by default).
+    :param cacheDirectory: string. The directory of the on-disk lineup cache, shared by the workers, or None.
+    :return: dict. The number of rosters analysed, failed and skipped, and the throughput in rosters per minute.
+    """
+    workers = workers or os.cpu_count()
+    chunkSize = chunkSize or 4 * workers
+    done = completedRosters(output)
+    tasks = ((source, name, cacheDirectory) for name in rosterNames(source) if name not in done)
+    progress = {'analysed': 0, 'failed': 0, 'skipped': len(done), 'rostersPerMinute': 0}
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as executor, open(output, 'a') as f:
+        while True:
+            chunk = list(itertools.islice(tasks, chunkSize))
+            if not chunk:
+                break
+            for result in executor.map(analyseRoster, chunk):
+                f.write(json.dumps(result) + '\n')
+                progress['failed' if 'error' in result else 'analysed'] += 1
+            f.flush()
+            os.fsync(f.fileno())
+            progress['rostersPerMinute'] = 60 * (progress['analysed'] + progress['failed']) / (time.time() - start)
+            print(str(progress['analysed']) + ' rosters analysed, ' + str(progress['failed']) + ' failed, '
+                  + str(progress['skipped']) + ' skipped, ' + str(round(progress['rostersPerMinute'], 1))
+                  + ' rosters/min', flush=True)
+    return progress
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Computes the best and worst lineups of many rosters, resumably.')
+    parser.add_argument('source', help='Directory tree of csv files, or roster store directory.')
+    parser.add_argument('--output', default='pipeline.jsonl', help='Path of the JSON lines output and checkpoint.')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes.')
+    parser.add_argument('--chunk-size', type=int, default=None, help='Number of rosters in memory at once.')
+    parser.add_argument('--cache-dir', default=None, help='Directory of the on-disk lineup cache.')
+    args = parser.parse_args(argv)
+    runPipeline(args.source, args.output, args.workers, args.chunk_size, args.cache_dir)
+
+
+if __name__ == "__main__":
+    main()
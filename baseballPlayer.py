@@ -1,10 +1,43 @@
 import numpy as np
-from baseballMC import State
+from baseballKernel import kernelFromRates
+
+# The columns of the stats matrices that Players are views into
+statFields = ('pa', 'b1', 'b2', 'b3', 'b4', 'bb', 'outs', 'ops')
+# The columns divided by the plate appearances to get the rates of a walk, single, double, triple, home run and out
+rateColumns = [5, 1, 2, 3, 4, 6]
+
+
+def statsMatrix(rows):
+    """
+    :param rows: [(int, int, int, int, int, int, float)]. For each player, the pa, b1, b2, b3, b4, bb and ops.
+    :return: numpy (n, 8) array. The stats matrix of the players, with the columns in statFields.
+    """
+    stats = np.zeros((len(rows), len(statFields)))
+    if len(rows):
+        stats[:, [0, 1, 2, 3, 4, 5, 7]] = rows
+        stats[:, 6] = stats[:, 0] - stats[:, 1] - stats[:, 2] - stats[:, 3] - stats[:, 4] - stats[:, 5]
+    return stats
+
+
+def rateMatrix(stats):
+    """
+    :param stats: numpy (n, 8) array. A stats matrix, with the columns in statFields.
+    :return: numpy (n, 6) array. The probabilities of a walk, single, double, triple, home run and out for each player.
+    """
+    return stats[:, rateColumns] / stats[:, :1]
+
+
+def _stat(column):
+    return property(lambda self: self.stats[self.row, column].item(),
+                    doc='The ' + statFields[column] + ' of the player.')
+
 
 class Player:
     """
-    Represents a baseball player.
+    Represents a baseball player, as a view into a row of a stats matrix (shared with the other players of a Team).
     """
+    __slots__ = ('id', 'name', 'stats', 'rateRows', 'row')
+
     def __init__(self, playerID, name, pa, b1, b2, b3, b4, bb, ops):
         """
         :param playerID: int. A unique identifier for the player.
@@ -17,49 +50,58 @@ class Player:
         :param bb: int. The number of walks, IBBs and HBPs for the player.
         :param ops: float. The player's ops.
         """
+        stats = statsMatrix([(pa, b1, b2, b3, b4, bb, ops)])
+        self.bind(playerID, name, stats, rateMatrix(stats), 0)
+
+    @classmethod
+    def view(cls, playerID, name, stats, rateRows, row):
+        """
+        Creates a player whose stats are a row of existing matrices, without copying them.
+        :param playerID: int. A unique identifier for the player.
+        :param name: string. The player's name.
+        :param stats: numpy (n, 8) array. The stats matrix, with the columns in statFields.
+        :param rateRows: numpy (n, 6) array. The rates matrix computed from stats by rateMatrix.
+        :param row: int. The row of the player in the matrices.
+        :return: Player. The player.
+        """
+        player = cls.__new__(cls)
+        player.bind(playerID, name, stats, rateRows, row)
+        return player
+
+    def bind(self, playerID, name, stats, rateRows, row):
         self.id = playerID
         self.name = name
-        self.pa = pa
-        self.outs = pa - b1 - b2 - b3 - b4 - bb
-        self.b1 = b1
-        self.b2 = b2
-        self.b3 = b3
-        self.b4 = b4
-        self.bb = bb
-        self.ops = ops
+        self.stats = stats
+        self.rateRows = rateRows
+        self.row = row
+
+    pa = _stat(0)
+    b1 = _stat(1)
+    b2 = _stat(2)
+    b3 = _stat(3)
+    b4 = _stat(4)
+    bb = _stat(5)
+    outs = _stat(6)
+    ops = _stat(7)
+
+    def rates(self):
+        """
+        :return: (float). The probabilities of a walk, single, double, triple, home run and out for this player.
+        """
+        return tuple(self.rateRows[self.row].tolist())
 
     def transitionMatrixSimple(self):
         """
         Computes the transition matrix for this player for the baseball MC.
-        :return: numpy (217, 217) array. The transition matrix for this player.
+        :return: numpy (5, 217, 217) array. The transition matrix for this player.
         """
-        # p[i]: the transition matrix when i runs score
-        p = np.zeros((5, 217, 217))
-        
-        # Once a state with 9 innings and three outs is reached, it never changes again.
-        p[0][216][216] = 1
-
-        # Compute all the transition probabilities
-        for i in range(216):
-            # Current state
-            currState = State(i)
-            # If the batter gets walked
-            (nextState, runs) = currState.walk()
-            p[runs][i][nextState] += self.bb/self.pa
-            # If the batter hits a single
-            (nextState, runs) = currState.single()
-            p[runs][i][nextState] += self.b1/self.pa
-            # If the batter hits a double
-            (nextState, runs) = currState.double()
-            p[runs][i][nextState] += self.b2/self.pa
-            # If the batter hits a triple
-            (nextState, runs) = currState.triple()
-            p[runs][i][nextState] += self.b3/self.pa
-            # If the batter hits a home run
-            (nextState, runs) = currState.homeRun()
-            p[runs][i][nextState] += self.b4/self.pa
-            # If the batter gets out
-            (nextState, runs) = currState.out()
-            p[runs][i][nextState] += self.outs/self.pa
-        return p
+        return self.transitionKernel().toDense()
 
+    def transitionKernel(self, model=None):
+        """
+        Computes the sparse transition kernel for this player for the baseball MC. Kernels are memoized by the
+        player's rates, so they are shared by every player with the same rates.
+        :param model: EventModel. The event model, or None for the six events of baseballMC.State.
+        :return: TransitionKernel. The non-zero entries of this player's transition matrix.
+        """
+        return kernelFromRates(self.rates(), model)
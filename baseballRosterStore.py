@@ -0,0 +1,117 @@
+"""
+Columnar store of rosters, to load many teams without parsing their csv files.
+
+ingestRosters converts a directory tree of FanGraphs csv files into a store directory of .npy arrays, one column per
+field used by Player, with the players of each team contiguous. RosterStore memory-maps the columns once, and builds
+the Teams from slices of them.
+
+    store = ingestRosters('TeamData', 'rosterStore')
+    redsox = RosterStore('rosterStore').team('AL/redsox')
+"""
+import os
+import numpy as np
+from baseballTeam import Team, readRows
+from baseballPlayer import Player
+
+
+# The counting stats of the players, in the order of the rows of counts.npy
+countFields = ('pa', 'b1', 'b2', 'b3', 'b4', 'bb')
+
+
+def ingestRosters(directory, storeDirectory):
+    """
+    Converts the csv files in a directory, and its subdirectories, into a roster store.
+    :param directory: string. The directory containing the teams' csv files.
+    :param storeDirectory: string. The directory the store is written to.
+    :return: RosterStore. The store.
+    """
+    teams = []
+    for (root, dirs, files) in os.walk(directory):
+        dirs.sort()
+        for f in sorted(files):
+            if f.endswith('.csv'):
+                path = os.path.join(root, f)
+                # The teams are named by their path relative to the directory, e.g. 'AL/redsox'
+                name = os.path.splitext(os.path.relpath(path, directory))[0].replace(os.sep, '/')
+                teams.append((name, readRows(path)))
+    rows = [row for (name, teamRows) in teams for row in teamRows]
+    names = np.array([name for (name, teamRows) in teams], dtype=str)
+    stops = np.cumsum([len(teamRows) for (name, teamRows) in teams], dtype=np.int64)
+    index = np.zeros(len(teams), dtype=[('name', names.dtype), ('start', np.int64), ('stop', np.int64)])
+    index['name'] = names
+    index['start'] = np.concatenate([[0], stops[:-1]])
+    index['stop'] = stops
+    os.makedirs(storeDirectory, exist_ok=True)
+    save = lambda name, array: np.save(os.path.join(storeDirectory, name + '.npy'), array)
+    save('teams', index)
+    save('ids', np.array([str(row[0]) for row in rows], dtype=str))
+    save('names', np.array([row[1] for row in rows], dtype=str))
+    save('counts', np.array([row[2:8] for row in rows], dtype=np.int64).reshape(-1, len(countFields)).T.copy())
+    save('ops', np.array([row[8] for row in rows], dtype=np.float64))
+    return RosterStore(storeDirectory)
+
+
+class RosterStore:
+    """
+    Memory-mapped rosters written by ingestRosters.
+    """
+    def __init__(self, storeDirectory):
+        """
+        :param storeDirectory: string. The directory of the store.
+        """
+        load = lambda name: np.load(os.path.join(storeDirectory, name + '.npy'), mmap_mode='r')
+        self.index = load('teams')
+        self.ids = load('ids')
+        self.names = load('names')
+        # counts[f][p]: the value of countFields[f] for player p
+        self.counts = load('counts')
+        self.ops = load('ops')
+        self.positions = dict(map(lambda i: (str(self.index['name'][i]), i), range(len(self.index))))
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, name):
+        return name in self.positions
+
+    def teamNames(self):
+        """
+        :return: [string]. The names of the teams in the store, in order.
+        """
+        return list(self.positions)
+
+    def team(self, name):
+        """
+        :param name: string. The name of the team, e.g. 'AL/redsox'.
+        :return: Team. The team, with the players of the store.
+        """
+        entry = self.index[self.positions[name]]
+        players = slice(entry['start'], entry['stop'])
+        counts = np.array(self.counts[:, players]).T.tolist()
+        batters = [Player(str(playerID), str(playerName), *playerCounts, float(ops))
+                   for (playerID, playerName, playerCounts, ops)
+                   in zip(self.ids[players], self.names[players], counts, self.ops[players])]
+        # Teams are named like loadData names them, by the name of their csv file
+        return Team(name.split('/')[-1], batters, [])
+
+    def teams(self, names=None):
+        """
+        :param names: [string]. The names of the teams, or None for every team in the store.
+        :return: generator of Team. The teams, built one at a time.
+        """
+        for name in (self.teamNames() if names is None else names):
+            yield self.team(name)
+
+
+if __name__ == "__main__":
+    import time
+    from baseballTeam import loadData
+
+    start = time.time()
+    store = ingestRosters('TeamData', 'rosterStore')
+    print('Ingested ' + str(len(store)) + ' teams in ' + str(round(time.time() - start, 3)) + 's')
+    start = time.time()
+    teams = list(RosterStore('rosterStore').teams())
+    print('Loaded ' + str(len(teams)) + ' teams in ' + str(round(time.time() - start, 3)) + 's')
+    redsox = RosterStore('rosterStore').team('AL/redsox')
+    print(redsox.averagePlayer().rates() == loadData('redsox').averagePlayer().rates())
@@ -0,0 +1,168 @@
+"""
+Head-to-head win probabilities between all the teams of a league, and projections of whole seasons.
+
+Each team's best lineup and inning engine are computed once, instead of once per game as in game(team1, team2). The
+pairwise win probabilities (ties included, settled in extra innings) are then products of the stacked run
+distributions, and seasons are projected from the win matrix, analytically or by simulating schedules.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import numpy as np
+from baseballTeam import loadData
+from baseballCache import LineupCache
+from baseballInnings import InningEngine
+from baseballSimulator import teamsAL, formBestLineup
+
+
+class League:
+    """
+    Run distributions and head-to-head win probabilities of the teams of a league.
+    """
+    def __init__(self, teams, lineups=None, cache=None, workers=1, maxRuns=20):
+        """
+        :param teams: [Team]. The teams of the league.
+        :param lineups: [[Batter]]. The lineup of each team (formBestLineup(team) by default).
+        :param cache: LineupCache. The cache used by formBestLineup, or None. With several workers, it must have an
+            on-disk store, which the workers share.
+        :param workers: int. The number of worker processes forming the lineups.
+        :param maxRuns: int. The largest number of runs tracked in the run distributions.
+        """
+        self.teams = teams
+        self.names = list(map(lambda Team: Team.name, teams))
+        if lineups is None:
+            if workers == 1:
+                lineups = [formBestLineup(team, cache) for team in teams]
+            else:
+                if cache is not None and cache.directory is None:
+                    raise ValueError('The workers can only share a lineup cache with an on-disk store.')
+                settings = None if cache is None else (cache.directory, cache.memoryEntries, cache.maxDiskBytes)
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    lineups = list(executor.map(functools.partial(_formBestLineup, settings=settings), teams))
+        self.lineups = lineups
+        self.engines = [InningEngine(lineup, maxRuns) for lineup in lineups]
+        # games[t][r]: the probability that team t scores r runs in nine innings
+        self.games = np.array([engine.gameDistribution() for engine in self.engines])
+        # extra[t][r]: the probability that team t scores r runs in an extra inning
+        self.extra = np.array([np.linalg.matrix_power(engine.nextLeadoff, 9)[0] @ engine.innings.sum(axis=2)
+                               for engine in self.engines])
+        self.winMatrix = winMatrix(self.games, self.extra)
+
+    def winProbability(self, home, away):
+        """
+        :param home: string. The name of the home team.
+        :param away: string. The name of the away team.
+        :return: float. The probability that the home team wins.
+        """
+        return self.winMatrix[self.names.index(home), self.names.index(away)]
+
+
+def _formBestLineup(team, settings=None):
+    # Runs in a worker process, with its own cache on the shared on-disk store
+    return formBestLineup(team, LineupCache(*settings) if settings is not None else None)
+
+
+def winMatrix(games, extra):
+    """
+    Computes the probability that each team beats each other team.
+    :param games: numpy (T, maxRuns + 1) array. The run distribution of each team in nine innings.
+    :param extra: numpy (T, maxRuns + 1) array. The run distribution of each team in an extra inning.
+    :return: numpy (T, T) array. Element [h][a] is the probability that team h beats team a at home.
+    """
+    # more[x][y]: whether x runs beat y runs
+    more = np.tril(np.ones((games.shape[1], games.shape[1])), -1)
+    win = games @ more @ games.T
+    tie = games @ games.T
+    extraWin = extra @ more @ extra.T
+    extraLose = extra @ more.T @ extra.T
+    return win + tie * extraWin / (extraWin + extraLose)
+
+
+def balancedSchedule(nTeams, games=162):
+    """
+    Builds a schedule where every team plays the same number of games, spread as evenly as possible over its
+    opponents, with as many home games as away games. The opponents a team plays one game more against are its
+    nearest neighbours in the order of the teams.
+    :param nTeams: int. The number of teams.
+    :param games: int. The number of games each team plays.
+    :return: numpy (nTeams, nTeams) int array. Element [h][a] is the number of games team h hosts team a.
+    """
+    # Team t plays team t + d as often as team t - d, so games are handed out by pairs of opposite offsets
+    perOffset = np.full(nTeams, games // (nTeams - 1))
+    remaining = games % (nTeams - 1)
+    for d in range(1, nTeams // 2 + 1):
+        offsets = {d, nTeams - d}
+        if len(offsets) <= remaining:
+            perOffset[list(offsets)] += 1
+            remaining -= len(offsets)
+    if remaining or (nTeams % 2 == 0 and perOffset[nTeams // 2] % 2):
+        raise ValueError('Cannot schedule ' + str(games) + ' games for each of ' + str(nTeams) + ' teams.')
+    schedule = np.zeros((nTeams, nTeams), dtype=np.int64)
+    for d in range(1, nTeams):
+        # Against t + d, team t hosts the larger half of the games (its opponent hosts the rest, as t + d - d)
+        home = (perOffset[d] + 1) // 2 if d < nTeams - d else perOffset[d] // 2
+        for t in range(nTeams):
+            schedule[t, (t + d) % nTeams] = home
+    return schedule
+
+
+def projectSeason(winMatrix, schedule):
+    """
+    Projects the standings of a season analytically, from the win probability of every game.
+    :param winMatrix: numpy (T, T) array. Element [h][a] is the probability that team h beats team a at home.
+    :param schedule: numpy (T, T) int array. Element [h][a] is the number of games team h hosts team a.
+    :return: (numpy array, numpy array). The expected number of wins of each team, and the distribution of the
+        number of wins of each team (element [t][w] is the probability that team t wins w games).
+    """
+    nTeams = len(schedule)
+    expectedWins = (schedule * winMatrix).sum(axis=1) + (schedule * (1 - winMatrix)).sum(axis=0)
+    nGames = schedule.sum(axis=1) + schedule.sum(axis=0)
+    wins = np.zeros((nTeams, nGames.max() + 1))
+    for t in range(nTeams):
+        # Probability of winning each game, at home then away
+        p = np.concatenate([np.repeat(winMatrix[t], schedule[t]), np.repeat(1 - winMatrix[:, t], schedule[:, t])])
+        u = np.zeros(len(p) + 1)
+        u[0] = 1
+        for (n, q) in enumerate(p):
+            u[1:n + 2] = u[1:n + 2] * (1 - q) + u[:n + 1] * q
+            u[0] *= 1 - q
+        wins[t, :len(u)] = u
+    return (expectedWins, wins)
+
+
+def simulateSeasons(winMatrix, schedule, nSeasons, seed=None):
+    """
+    Simulates seasons, playing every series of games between two teams at once.
+    :param winMatrix: numpy (T, T) array. Element [h][a] is the probability that team h beats team a at home.
+    :param schedule: numpy (T, T) int array. Element [h][a] is the number of games team h hosts team a.
+    :param nSeasons: int. The number of seasons simulated.
+    :param seed: int. The seed of the random numbers.
+    :return: numpy (nSeasons, T) int array. The number of wins of each team in each season.
+    """
+    rng = np.random.default_rng(seed)
+    nTeams = len(schedule)
+    homeWins = rng.binomial(schedule, winMatrix, size=(nSeasons, nTeams, nTeams))
+    return homeWins.sum(axis=2) + (schedule - homeWins).sum(axis=1)
+
+
+def bestRecordProbabilities(seasons, seed=None):
+    """
+    :param seasons: numpy (nSeasons, T) int array. The number of wins of each team in each season.
+    :param seed: int. The seed of the random numbers breaking ties between the best records.
+    :return: numpy array. The probability that each team finishes with the best record.
+    """
+    rng = np.random.default_rng(seed)
+    # Ties are broken by adding a random fraction of a win
+    first = np.argmax(seasons + rng.random(seasons.shape), axis=1)
+    return np.bincount(first, minlength=seasons.shape[1]) / len(seasons)
+
+
+if __name__ == "__main__":
+    league = League(list(map(loadData, teamsAL)))
+    schedule = balancedSchedule(len(teamsAL))
+    (expectedWins, wins) = projectSeason(league.winMatrix, schedule)
+    seasons = simulateSeasons(league.winMatrix, schedule, 100000, seed=2018)
+    first = bestRecordProbabilities(seasons, seed=2018)
+    print('Projected standings:')
+    for t in np.argsort(-expectedWins):
+        print(league.names[t] + ': ' + str(round(expectedWins[t], 1)) + ' wins (' + str(round(seasons[:, t].std(), 1))
+              + ' std), best record ' + str(round(100 * first[t], 1)) + '%')
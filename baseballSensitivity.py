@@ -0,0 +1,222 @@
+"""
+Exact sensitivities of expected runs and win probabilities to the event probabilities of each lineup slot.
+
+The derivative of a game's outcome with respect to the probability p[b][e] of event e for the batter in slot b is
+the expected number of times each (state, slot b up) pair is visited, times the value of the state event e leads to
+from it. The visits come from one forward pass through the same chain as simulateMarkovChain (or, for expected runs,
+from the fundamental matrix of the half-inning), and the values from the AbsorbingChain, so that the gradient for all
+the slots and events costs about as much as one solve instead of one perturbed solve for each of them. The
+probability of winning in extra innings depends on the distribution of the 10th inning, which is differentiated
+separately through the half-inning solve (see extraInningGradient).
+
+The six probabilities are treated as independent variables. The effect of turning outs into walks, say, is the
+difference between the walk and out columns of the gradient (see eventValues).
+"""
+import numpy as np
+from baseballMC import eventNames, eventTargets, eventRuns
+from baseballKernel import kernelFromRates, propagateInto, workBuffers
+from baseballAbsorbing import AbsorbingChain, halfInningBlocks
+from baseballInnings import InningEngine
+
+
+def visits(kernels, maxRuns=20, tolerance=1e-12, maxIterations=2000):
+    """
+    Computes the expected number of plate appearances made from each (runs scored, state, batter up) triple in a game.
+    :param kernels: [TransitionKernel]. The transition kernels for the batters in the lineup, in order.
+    :param maxRuns: int. The largest number of runs tracked.
+    :param tolerance: float. The propagation stops once the probability that the game is still going is below this.
+    :param maxIterations: int. The largest number of plate appearances propagated.
+    :return: numpy (maxRuns + 1, 217, n) array. Element [k][s][b] is the expected number of plate appearances made in
+        state s with batter b up and k runs already scored.
+    """
+    n = len(kernels)
+    size = (maxRuns + 1) * 217
+    visited = np.zeros((maxRuns + 1, 217, n))
+    u = np.zeros(size + 1)
+    u[0] = 1
+    out = np.zeros(size + 1)
+    buffers = workBuffers(kernels, maxRuns)
+    for i in range(maxIterations):
+        current = u[:size].reshape(maxRuns + 1, 217)
+        if current[:, :216].sum() < tolerance:
+            break
+        visited[:, :216, i % n] += current[:, :216]
+        propagateInto(u, out, kernels[i % n], buffers)
+        (u, out) = (out, u)
+    return visited
+
+
+def expectedRunsGradient(lineup):
+    """
+    Computes the expected runs of a lineup in a game, and their gradient with respect to the event probabilities of
+    each slot. Runs beyond any maximum are included.
+    :param lineup: [Batter]. List containing the 9 batters in the lineup, in order.
+    :return: (float, numpy (n, 6) array). The expected runs, and their derivative with respect to the probability of
+        a walk, single, double, triple, home run and out (in that order) of the batter in each slot.
+    """
+    n = len(lineup)
+    chain = AbsorbingChain(lineup)
+    (Q, X) = halfInningBlocks(list(map(lambda Batter: Batter.transitionKernel(), lineup)))
+    # The expected number of visits to each local half-inning state, from each leadoff slot
+    fundamental = np.linalg.inv(np.eye(24 * n) - Q.sum(axis=0))[:n]
+    nextLeadoff = fundamental @ X.sum(axis=0)
+    visited = np.zeros((216, n))
+    leadoff = np.zeros(n)
+    leadoff[0] = 1
+    for inning in range(9):
+        visited[24 * inning:24 * (inning + 1)] = (leadoff @ fundamental).reshape(24, n)
+        leadoff = leadoff @ nextLeadoff
+    nextBatter = np.roll(np.arange(n), -1)
+    gradient = np.zeros((n, len(eventNames)))
+    for e in range(len(eventNames)):
+        # The runs scored by event e from each state, plus the expected runs from the state it leads to
+        value = eventRuns[e][:, None] + chain.expected[eventTargets[e]][:, nextBatter]
+        gradient[:, e] = (visited * value).sum(axis=0)
+    return (chain.expectedRemainingRuns(), gradient)
+
+
+def payoffGradient(lineup, payoff, tolerance=1e-12):
+    """
+    Computes the expected payoff of a lineup's final score, and its gradient with respect to the event
+    probabilities of each slot.
+    :param lineup: [Batter]. List containing the 9 batters in the lineup, in order.
+    :param payoff: numpy array. The payoff of scoring each number of runs, from 0 to maxRuns. Like the run
+        distributions, scores beyond maxRuns are left out (their payoff is 0).
+    :param tolerance: float. The probability that a game is still going below which the forward pass stops.
+    :return: (float, numpy (n, 6) array). The expected payoff, and its derivative with respect to the probability of
+        a walk, single, double, triple, home run and out (in that order) of the batter in each slot.
+    """
+    n = len(lineup)
+    maxRuns = len(payoff) - 1
+    chain = AbsorbingChain(lineup, maxRuns)
+    visited = visits(list(map(lambda Batter: Batter.transitionKernel(), lineup)), maxRuns, tolerance)
+    # value[m][t][b]: the expected payoff from state t with batter b up and m runs already scored
+    scored = np.arange(maxRuns + int(eventRuns.max()) + 1)
+    final = scored[:, None] + np.arange(maxRuns + 1)[None, :]
+    value = np.einsum('mj,jtb->mtb', np.concatenate((payoff, np.zeros(len(scored))))[final], chain.distributions)
+    nextBatter = np.roll(np.arange(n), -1)
+    k = np.arange(maxRuns + 1)[:, None]
+    gradient = np.zeros((n, len(eventNames)))
+    for e in range(len(eventNames)):
+        after = value[k + eventRuns[e][None, :], eventTargets[e][None, :]][:, :, nextBatter]
+        gradient[:, e] = (visited[:, :216] * after).sum(axis=(0, 1))
+    return (chain.runDistribution() @ payoff, gradient)
+
+
+def extraInningGradient(lineup, payoff):
+    """
+    Computes the gradient of the expected payoff of the runs a lineup scores in the 10th inning (the first extra
+    inning, as in extraInningsWinProbability), with respect to the event probabilities of each slot. The probabilities
+    enter the half-inning blocks linearly, so each derivative is one forward-mode pass through the half-inning solve
+    of solveHalfInnings, with the blocks of the batter's kernel for a single event.
+    :param lineup: [Batter]. List containing the 9 batters in the lineup, in order.
+    :param payoff: numpy array. The payoff of scoring each number of runs in the inning, from 0 to maxRuns.
+    :return: numpy (n, 6) array. The derivative of the expected payoff with respect to the probability of a walk,
+        single, double, triple, home run and out (in that order) of the batter in each slot.
+    """
+    n = len(lineup)
+    maxRuns = len(payoff) - 1
+    (Q, X) = halfInningBlocks(list(map(lambda Batter: Batter.transitionKernel(), lineup)))
+    size = 24 * n
+    fundamental = np.linalg.inv(np.eye(size) - Q[0])
+    # local[k][j][c]: the probability of scoring exactly k runs from local state j, with batter c due up next
+    local = np.zeros((maxRuns + 1, size, n))
+    for k in range(maxRuns + 1):
+        rhs = X[k].copy() if k < Q.shape[0] else np.zeros((size, n))
+        for r in range(1, min(k, Q.shape[0] - 1) + 1):
+            rhs += Q[r] @ local[k - r]
+        local[k] = fundamental @ rhs
+    # nextLeadoff for every local state, including half-innings with more than maxRuns runs
+    absorbing = np.linalg.inv(np.eye(size) - Q.sum(axis=0))
+    leadoffs = absorbing @ X.sum(axis=0)
+    nextLeadoff = leadoffs[:n]
+    # before[j]: the leadoff distribution of inning j + 1, after[j]: the expected payoff of inning 10, from the
+    # leadoff of inning 10 - j
+    inningPayoff = np.einsum('k,klc->l', payoff, local[:, :n, :])
+    before = [np.eye(n)[0]]
+    after = [inningPayoff]
+    for j in range(9):
+        before.append(before[-1] @ nextLeadoff)
+        after.append(nextLeadoff @ after[-1])
+    zero = kernelFromRates((0.0,) * len(eventNames))
+    gradient = np.zeros((n, len(eventNames)))
+    for b in range(n):
+        for e in range(len(eventNames)):
+            kernels = [zero] * n
+            kernels[b] = kernelFromRates(tuple(np.eye(len(eventNames))[e]))
+            (dQ, dX) = halfInningBlocks(kernels)
+            dLocal = np.zeros(local.shape)
+            for k in range(maxRuns + 1):
+                rhs = dQ[0] @ local[k] + (dX[k] if k < dQ.shape[0] else 0)
+                for r in range(1, min(k, Q.shape[0] - 1) + 1):
+                    rhs += dQ[r] @ local[k - r] + Q[r] @ dLocal[k - r]
+                dLocal[k] = fundamental @ rhs
+            dNextLeadoff = (absorbing @ (dQ.sum(axis=0) @ leadoffs + dX.sum(axis=0)))[:n]
+            gradient[b, e] = (before[9] @ np.einsum('k,klc->l', payoff, dLocal[:, :n, :])
+                              + sum(before[j] @ dNextLeadoff @ after[8 - j] for j in range(9)))
+    return gradient
+
+
+def winProbabilityGradient(homeLineup, awayLineup, maxRuns=20):
+    """
+    Computes the probability that the home team wins (as gameWinProbability does), and its gradient with respect to
+    the event probabilities of each slot of both lineups, extra innings included.
+    :param homeLineup: [Batter]. List containing the 9 batters in the home lineup, in order.
+    :param awayLineup: [Batter]. List containing the 9 batters in the away lineup, in order.
+    :param maxRuns: int. The largest number of runs tracked in the run distributions.
+    :return: (float, numpy (n, 6) array, numpy (n, 6) array). The probability that the home team wins, and its
+        gradients with respect to the event probabilities of the home and away slots.
+    """
+    homeEngine = InningEngine(homeLineup, maxRuns)
+    awayEngine = InningEngine(awayLineup, maxRuns)
+    # The run distributions of an extra inning, as in extraInningsWinProbability
+    (homeInning, awayInning) = map(lambda engine: np.linalg.matrix_power(engine.nextLeadoff, 9)[0]
+                                   @ engine.innings.sum(axis=2), (homeEngine, awayEngine))
+    # less[x]: the probability that the other team scores fewer than x runs in the inning, more[x]: more than x
+    less = lambda inning: np.concatenate(([0], np.cumsum(inning)[:-1]))
+    more = lambda inning: inning.sum() - np.cumsum(inning)
+    (win, lose) = (homeInning @ less(awayInning), homeInning @ more(awayInning))
+    extra = win / (win + lose)
+    home = homeEngine.gameDistribution()
+    away = awayEngine.gameDistribution()
+    # The probability that the home team wins when it scores x runs, and when the away team scores y runs
+    homePayoff = np.concatenate(([0], np.cumsum(away)[:-1])) + extra * away
+    awayPayoff = home.sum() - np.cumsum(home) + extra * home
+    (p, homeGradient) = payoffGradient(homeLineup, homePayoff)
+    awayGradient = payoffGradient(awayLineup, awayPayoff)[1]
+    # The probability of winning in extra innings changes too, weighted by the probability of a tie after nine
+    # innings: d(extra) = (lose * d(win) - win * d(lose)) / (win + lose)^2
+    tied = home @ away / (win + lose) ** 2
+    homeGradient += tied * extraInningGradient(homeLineup, lose * less(awayInning) - win * more(awayInning))
+    awayGradient += tied * extraInningGradient(awayLineup, lose * more(homeInning) - win * less(homeInning))
+    return (p, homeGradient, awayGradient)
+
+
+def eventValues(gradient):
+    """
+    :param gradient: numpy (n, 6) array. A gradient with respect to the event probabilities of each slot.
+    :return: numpy (n, 5) array. The change in the outcome per unit of probability moved from outs to a walk,
+        single, double, triple and home run (in that order), for each slot.
+    """
+    return gradient[:, :5] - gradient[:, 5:]
+
+
+if __name__ == "__main__":
+    from baseballTeam import loadData
+    from baseballSimulator import formBestLineup
+
+    redsox = formBestLineup(loadData('redsox'))
+    yankees = formBestLineup(loadData('yankees'))
+    (runs, gradient) = expectedRunsGradient(redsox)
+    (p, homeGradient, awayGradient) = winProbabilityGradient(redsox, yankees)
+    print('Expected runs of the Red Sox: ' + str(round(runs, 3)) + ', win probability against the Yankees: '
+          + str(round(100 * p, 2)) + '%')
+    print('Runs per game, and win probability, gained by turning 1% of plate appearances from outs into walks or '
+          'home runs:')
+    runValues = eventValues(gradient)
+    winValues = eventValues(homeGradient)
+    for (slot, batter) in enumerate(redsox):
+        print(str(slot + 1) + '. ' + batter.name + ': walks ' + str(round(0.01 * runValues[slot, 0], 4)) + ' runs, '
+              + str(round(0.01 * winValues[slot, 0] * 100, 3)) + '%, home runs '
+              + str(round(0.01 * runValues[slot, 4], 4)) + ' runs, ' + str(round(0.01 * winValues[slot, 4] * 100, 3))
+              + '%')
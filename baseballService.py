@@ -0,0 +1,320 @@
+"""
+Long-running local service answering lineup queries, with the rosters, lineups and kernels kept warm.
+
+The service loads every roster once, and keeps the best lineup, absorbing chain and inning engine of each team once
+they have been computed. Lineup orders to evaluate are not solved one at a time: the ones arriving within a short
+window are coalesced into a single batched evaluation (expectedRunsBatch), split over a process pool.
+
+It speaks plain HTTP/1.1 (GET with query parameters, or POST with a JSON body) and only listens on the loopback
+interface or on a Unix socket. Every response is a JSON object.
+
+    python baseballService.py --port 8765 --workers 4
+    curl 'http://127.0.0.1:8765/expectedRuns?team=redsox'
+    curl 'http://127.0.0.1:8765/expectedRuns?team=redsox&order=13611,...'
+    curl 'http://127.0.0.1:8765/game?home=redsox&away=yankees'
+    curl 'http://127.0.0.1:8765/expectedRemainingRuns?team=angels&inning=9&outs=0&first=1&batterUp=1'
+    curl 'http://127.0.0.1:8765/bestLineup?team=redsox'
+"""
+import argparse
+import asyncio
+import functools
+import ipaddress
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit, parse_qsl
+import numpy as np
+from baseballMC import getID
+from baseballTeam import loadData
+from baseballAbsorbing import AbsorbingChain
+from baseballInnings import InningEngine
+from baseballLineupSearch import expectedRunsBatch
+from baseballWinProbability import gameWinProbability
+from baseballSimulator import formBestLineup
+
+
+class RequestError(Exception):
+    """
+    An error in a request, answered with the given HTTP status.
+    """
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _bestLineupPositions(team):
+    # Positions in team.batters, which are the same in the worker's copy of the team
+    positions = dict(map(lambda position: (id(team.batters[position]), position), range(len(team.batters))))
+    return [positions[id(batter)] for batter in formBestLineup(team)]
+
+
+class LineupService:
+    """
+    The state of the service: the rosters, and the results computed for them so far.
+    """
+    def __init__(self, directory='TeamData/AL/', workers=None, window=0.002, minChunk=64):
+        """
+        :param directory: string. The directory containing the teams' csv files, all loaded at start up.
+        :param workers: int. The number of worker processes (defaults to the number of CPUs).
+        :param window: float. The number of seconds lineup evaluations wait for others to batch with.
+        :param minChunk: int. The smallest number of lineups a batch is split into per worker.
+        """
+        names = sorted(os.path.splitext(f)[0] for f in os.listdir(directory) if f.endswith('.csv'))
+        self.teams = dict(map(lambda name: (name, loadData(name, directory)), names))
+        self.workers = workers or os.cpu_count()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self.window = window
+        self.minChunk = minChunk
+        # Futures of the results computed for each team, so that concurrent requests share one computation
+        self.lineups = {}
+        self.chains = {}
+        self.engines = {}
+        self.pending = []
+        self.flushing = None
+        self.stats = {'requests': 0, 'evaluations': 0, 'batches': 0}
+
+    def team(self, name):
+        if not isinstance(name, str):
+            raise RequestError(400, 'The team must be given by its name.')
+        if name not in self.teams:
+            raise RequestError(404, 'Unknown team: ' + str(name))
+        return self.teams[name]
+
+    def _memoized(self, results, key, compute, executor=None):
+        if key not in results:
+            future = asyncio.get_running_loop().run_in_executor(executor, compute)
+            results[key] = future
+            # A failed computation is not kept, so that the next request tries again
+            future.add_done_callback(
+                lambda done: results.pop(key, None) if done.cancelled() or done.exception() is not None else None)
+        return results[key]
+
+    async def bestLineup(self, name):
+        """
+        :param name: string. The name of the team.
+        :return: [Batter]. The best lineup of the team, formed on the process pool the first time it is needed.
+        """
+        team = self.team(name)
+        positions = await self._memoized(self.lineups, name, functools.partial(_bestLineupPositions, team),
+                                         self.executor)
+        return [team.batters[position] for position in positions]
+
+    async def chain(self, name):
+        lineup = await self.bestLineup(name)
+        return await self._memoized(self.chains, name, lambda: AbsorbingChain(lineup))
+
+    async def engine(self, name):
+        lineup = await self.bestLineup(name)
+        return await self._memoized(self.engines, name, lambda: InningEngine(lineup))
+
+    async def evaluate(self, rates):
+        """
+        Computes the expected runs of a lineup, batched with the other lineups evaluated within the window.
+        :param rates: numpy (n, 6) array. The event probabilities of the batters of the lineup, in batting order.
+        :return: float. The expected runs of the lineup.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((rates, future))
+        if self.flushing is None:
+            self.flushing = asyncio.ensure_future(self._flush())
+        return await future
+
+    async def _flush(self):
+        await asyncio.sleep(self.window)
+        (batch, self.pending, self.flushing) = (self.pending, [], None)
+        loop = asyncio.get_running_loop()
+        # Lineups of different lengths cannot be stacked, so they are batched separately
+        groups = {}
+        for (rates, future) in batch:
+            groups.setdefault(rates.shape, []).append((rates, future))
+        for group in groups.values():
+            rates = np.stack([rates for (rates, future) in group])
+            nChunks = max(1, min(self.workers, math.ceil(len(rates) / self.minChunk)))
+            try:
+                chunks = await asyncio.gather(*[loop.run_in_executor(self.executor, expectedRunsBatch, chunk)
+                                                for chunk in np.array_split(rates, nChunks)])
+            except Exception as e:
+                for (rates, future) in group:
+                    future.set_exception(e)
+                continue
+            for ((rates, future), runs) in zip(group, np.concatenate(chunks)):
+                future.set_result(float(runs))
+            self.stats['evaluations'] += len(group)
+            self.stats['batches'] += 1
+
+    async def expectedRuns(self, params):
+        team = self.team(params.get('team'))
+        if 'rates' in params or 'order' in params:
+            if 'rates' in params:
+                try:
+                    rates = np.asarray(params['rates'], dtype=np.float64)
+                except (TypeError, ValueError):
+                    raise RequestError(400, 'rates must be a list of lists of numbers.')
+            else:
+                order = params['order'].split(',') if isinstance(params['order'], str) else params['order']
+                if not isinstance(order, list) or not all(isinstance(playerID, (str, int)) for playerID in order):
+                    raise RequestError(400, 'order must be a list of player ids.')
+                # Batters are looked up by player id, as several can share a name
+                batters = dict(map(lambda Batter: (Batter.id, Batter), team.batters))
+                order = list(map(str, order))
+                missing = [playerID for playerID in order if playerID not in batters]
+                if missing:
+                    raise RequestError(400, 'Unknown player ids: ' + ', '.join(missing))
+                rates = np.array([batters[playerID].rates() for playerID in order])
+            if rates.shape != (9, 6):
+                raise RequestError(400, 'A lineup needs 9 batters, with 6 event probabilities each.')
+            if not np.isfinite(rates).all() or (rates < 0).any() or not np.allclose(rates.sum(axis=1), 1, atol=1e-6):
+                raise RequestError(400, 'The event probabilities of each batter must be non-negative and sum to 1.')
+            return {'team': team.name, 'expectedRuns': await self.evaluate(rates)}
+        chain = await self.chain(team.name)
+        return {'team': team.name, 'lineup': list(map(lambda Batter: Batter.name, chain.lineup)),
+                'distribution': chain.runDistribution().tolist(), 'expectedRuns': float(chain.expectedRemainingRuns())}
+
+    async def game(self, params):
+        (home, away) = (self.team(params.get('home')), self.team(params.get('away')))
+        (homeEngine, awayEngine) = await asyncio.gather(self.engine(home.name), self.engine(away.name))
+        return {'home': home.name, 'away': away.name,
+                'homeWinProbability': float(gameWinProbability(homeEngine, awayEngine))}
+
+    async def expectedRemainingRuns(self, params):
+        team = self.team(params.get('team'))
+        try:
+            (inning, outs, batterUp) = (int(params.get('inning', 1)), int(params.get('outs', 0)),
+                                        int(params.get('batterUp', 0)))
+            bases = tuple(int(params.get(base, 0)) for base in ('first', 'second', 'third'))
+        except (TypeError, ValueError):
+            raise RequestError(400, 'inning, outs, batterUp, first, second and third must be integers.')
+        if not (1 <= inning <= 9 and 0 <= outs <= 2 and 0 <= batterUp <= 8 and set(bases) <= {0, 1}):
+            raise RequestError(400, 'The state of the game is out of range.')
+        chain = await self.chain(team.name)
+        return {'team': team.name, 'batter': chain.lineup[batterUp].name,
+                'expectedRemainingRuns': float(chain.expectedRemainingRuns(getID(*bases, outs, inning), batterUp))}
+
+    async def bestLineupEndpoint(self, params):
+        team = self.team(params.get('team'))
+        lineup = await self.bestLineup(team.name)
+        return {'team': team.name, 'lineup': list(map(lambda Batter: Batter.name, lineup)),
+                'playerIds': list(map(lambda Batter: Batter.id, lineup)),
+                'expectedRuns': await self.evaluate(np.array([batter.rates() for batter in lineup]))}
+
+    async def status(self, params):
+        return dict(self.stats, teams=sorted(self.teams), workers=self.workers, lineupsComputed=len(self.lineups))
+
+    async def dispatch(self, path, params):
+        """
+        :param path: string. The path of the request, naming the endpoint.
+        :param params: dict. The parameters of the request.
+        :return: dict. The response.
+        """
+        endpoints = {'/expectedRuns': self.expectedRuns, '/game': self.game,
+                     '/expectedRemainingRuns': self.expectedRemainingRuns, '/bestLineup': self.bestLineupEndpoint,
+                     '/status': self.status}
+        if path not in endpoints:
+            raise RequestError(404, 'Unknown endpoint: ' + path)
+        self.stats['requests'] += 1
+        return await endpoints[path](params)
+
+    async def handle(self, reader, writer):
+        """
+        Serves the HTTP requests of a connection, keeping it alive until the client closes it.
+        """
+        try:
+            while True:
+                requestLine = await reader.readline()
+                if not requestLine.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    (key, _, value) = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    length = -1
+                # Without a valid length, the end of the body is unknown, so the connection is closed after answering
+                body = await reader.readexactly(length) if length >= 0 else b''
+                close = length < 0 or headers.get('connection', '').lower() == 'close'
+                start = time.perf_counter()
+                try:
+                    if length < 0:
+                        raise RequestError(400, 'Invalid Content-Length: ' + headers['content-length'])
+                    (method, target, version) = requestLine.decode('latin-1').split()
+                    url = urlsplit(target)
+                    params = dict(parse_qsl(url.query))
+                    if body:
+                        data = json.loads(body)
+                        if not isinstance(data, dict):
+                            raise RequestError(400, 'The request body must be a JSON object.')
+                        params.update(data)
+                    (status, response) = (200, await self.dispatch(url.path, params))
+                except RequestError as e:
+                    (status, response) = (e.status, {'error': str(e)})
+                except ValueError as e:
+                    (status, response) = (400, {'error': 'Malformed request: ' + str(e)})
+                except Exception as e:
+                    # Answer anyway, so that the client is not left without a response
+                    (status, response) = (500, {'error': 'Internal error: ' + repr(e)})
+                response['milliseconds'] = 1000 * (time.perf_counter() - start)
+                payload = json.dumps(response).encode()
+                writer.write(('HTTP/1.1 ' + str(status) + (' OK' if status == 200 else ' Error') + '\r\n'
+                              + 'Content-Type: application/json\r\nContent-Length: ' + str(len(payload)) + '\r\n'
+                              + ('Connection: close\r\n' if close else '') + '\r\n').encode() + payload)
+                await writer.drain()
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(service, host='127.0.0.1', port=8765, socketPath=None, warm=True):
+    """
+    Runs the service until it is cancelled.
+    :param service: LineupService. The service.
+    :param host: string. The loopback address to listen on.
+    :param port: int. The port to listen on.
+    :param socketPath: string. The path of a Unix socket to listen on instead, or None.
+    :param warm: bool. Whether to form the best lineup of every team at start up.
+    """
+    if socketPath is not None:
+        server = await asyncio.start_unix_server(service.handle, path=socketPath)
+    else:
+        if host != 'localhost' and not ipaddress.ip_address(host).is_loopback:
+            raise ValueError('The service only listens on the loopback interface, not ' + host + '.')
+        server = await asyncio.start_server(service.handle, host, port)
+    if warm:
+        await asyncio.gather(*[service.chain(name) for name in service.teams])
+        await asyncio.gather(*[service.engine(name) for name in service.teams])
+    print('Serving ' + str(len(service.teams)) + ' teams on ' + (socketPath or host + ':' + str(port)), flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serves lineup evaluations to local clients.')
+    parser.add_argument('--directory', default='TeamData/AL/', help='Directory containing the csv files.')
+    parser.add_argument('--host', default='127.0.0.1', help='Loopback address to listen on.')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on.')
+    parser.add_argument('--socket', default=None, help='Path of a Unix socket to listen on instead.')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes.')
+    parser.add_argument('--window', type=float, default=0.002,
+                        help='Seconds lineup evaluations wait to be batched together.')
+    parser.add_argument('--no-warm', action='store_true', help='Do not form every best lineup at start up.')
+    args = parser.parse_args(argv)
+    service = LineupService(args.directory, args.workers, args.window)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.socket, not args.no_warm))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
 import numpy as np
 import time
 from baseballTeam import loadData
-from baseballTeam import Team
-from baseballPlayer import Player
-from baseballMC import State, getID
+from baseballMC import getID
+from baseballKernel import propagateInto, workBuffers
+from baseballAbsorbing import AbsorbingChain
+from baseballLineupSearch import expectedRunsBatch
+import baseballTelemetry as telemetry
 
 teamsAL = ['angels', 'astros', 'athletics', 'bluejays', 'indians',\
            'mariners', 'orioles', 'rangers', 'rays', 'redsox', 'royals',\
@@ -13,6 +15,8 @@ runsPerGame = [4.45, 4.92, 5.02, 4.38, 5.05,\
               4.18, 3.84, 4.55, 4.42, 5.41, 3.94,\
               3.89, 4.56, 4.05, 5.25]
 
+
+
 def game(team1, team2):
     """
     Simulates a game between two baseball Teams, prints the probability that team1 wins,
@@ -33,21 +37,84 @@ def game(team1, team2):
     return round(100*p, 2)
 
 
-def expectedRuns(lineup):
+def expectedRuns(lineup, cache=None, precision=None):
     """
     Computes the expected run distribution of a given baseball lineup.
     :param lineup: [Batter]. List containing the 9 batters in the lineup, in order.
-    :return: np.array. An array containing 21 elements. The i-th element is the probability
+    :param cache: LineupCache. A cache of run distributions to look the lineup up in, or None.
+    :param precision: dict. Keyword arguments of simulateMarkovChain (tolerance, maxRuns, dtype, maxIterations),
+        or None for the default settings.
+    :return: np.array. An array containing 21 elements (maxRuns + 1 in general). The i-th element is the probability
         that the lineup will score i runs.
     """
-    transitionsMatrices = list(map(lambda Batter: Batter.transitionMatrixSimple(), lineup))
-    return simulateMarkovChain(transitionsMatrices)[:, 216]
+    precision = precision or {}
+    def compute():
+        with telemetry.phase('kernels'):
+            kernels = list(map(lambda Batter: Batter.transitionKernel(), lineup))
+        # A copy, so that the distribution does not keep the whole propagation buffer alive
+        return np.ascontiguousarray(simulateMarkovChain(kernels, **precision)[:, 216])
+    if cache is None:
+        return compute()
+    settings = sorted((name, str(value)) for (name, value) in precision.items())
+    return cache.getOrCompute(lineup, compute, 'simulateMarkovChain', settings)
 
 
-def simulateMarkovChain(transitionMatrices):
+def simulateMarkovChain(kernels, batterUp=0, startStateID=0, tolerance=0.001, maxRuns=20, dtype=np.float64,
+                        maxIterations=1000, countTruncated=False):
     """
     Finds the near-steady state distribution of the MC representing our baseball game.
-    :param transitionMatrices: [numpy array]. List containing the 9 (217 by 217) transition matrices
+    :param kernels: [TransitionKernel]. List containing the 9 sparse transition kernels for the batters in the
+        lineup, in order.
+    :param batterUp: int. The position in the lineup of the first batter to come up.
+    :param startStateID: int. The stateID of the state the game starts from.
+    :param tolerance: float. The simulation stops once less than this probability is left unabsorbed.
+    :param maxRuns: int. The largest number of runs tracked. Games scoring more runs are dropped.
+    :param dtype: numpy dtype. The floating point type of the distributions (np.float64 or np.float32).
+    :param maxIterations: int. The largest number of plate appearances simulated.
+    :param countTruncated: bool. Whether the probability dropped for scoring more than maxRuns runs counts as
+        absorbed, so that the simulation stops once less than tolerance is left in games still being played. High
+        scoring lineups otherwise run all maxIterations plate appearances. Telemetry reports the dropped probability
+        either way.
+    :return: numpy (maxRuns + 1)x217 array. The i-th row in the array represents the states where i runs have been
+        scored.
+    """
+    size = (maxRuns + 1) * 217
+    # Two buffers, swapped at every step. The extra last element receives the mass dropped beyond maxRuns.
+    u = np.zeros(size + 1, dtype=dtype)
+    nextU = np.zeros(size + 1, dtype=dtype)
+    u[startStateID] = 1
+    # The absorbing state of every row of each buffer, as strided views
+    absorbedStates = u[:size].reshape(maxRuns + 1, 217)[:, 216]
+    nextAbsorbedStates = nextU[:size].reshape(maxRuns + 1, 217)[:, 216]
+    absorbed = absorbedStates.sum()
+    truncated = 0
+    # The probability that counts as absorbed
+    done = lambda: absorbed + (truncated if countTruncated else 0)
+    buffers = workBuffers(kernels, maxRuns, dtype)
+    iterations = 0
+    batter = batterUp
+    metrics = telemetry.active()
+    with telemetry.phase('propagate'):
+        while done() < 1 - tolerance and iterations < maxIterations:
+            truncated += propagateInto(u, nextU, kernels[batter], buffers)
+            (u, nextU) = (nextU, u)
+            (absorbedStates, nextAbsorbedStates) = (nextAbsorbedStates, absorbedStates)
+            absorbed = absorbedStates.sum()
+            batter = (batter + 1) % len(kernels)
+            iterations += 1
+            if metrics:
+                for m in metrics:
+                    m.onStep(iterations, absorbed, truncated)
+    if metrics:
+        for m in metrics:
+            m.onCall(iterations, absorbed, truncated, done() >= 1 - tolerance)
+    return u[:size].reshape(maxRuns + 1, 217)
+
+
+def simulateMarkovChainDense(transitionMatrices):
+    """
+    Reference implementation of simulateMarkovChain, using the dense transition matrices.
+    :param transitionMatrices: [numpy array]. List containing the 9 (5, 217, 217) transition matrices
         for the batters in the lineup, in order.
     :return: numpy 21x217 array. The i-th row in the array represents the states where i runs have been scored.
     """
@@ -68,77 +135,127 @@ def simulateMarkovChain(transitionMatrices):
     return u
 
 
-def formBestLineup(team):
+def scoreCandidates(lineups, cache=None, screening=False):
+    """
+    Scores the candidate lineups of a step of formBestLineup or formWorstLineup.
+    :param lineups: [[Batter]]. The candidate lineups.
+    :param cache: LineupCache. A cache of run distributions for the candidate lineups, or None.
+    :param screening: bool. Whether to score the candidates all at once with the batched half-inning evaluator (exact
+        expected runs), instead of one simulateMarkovChain each.
+    :return: [float]. The expected runs of each candidate.
+    """
+    if screening:
+        rates = np.array([[batter.rates() for batter in lineup] for lineup in lineups])
+        return list(expectedRunsBatch(rates))
+    scores = []
+    for lineup in lineups:
+        scoreDistribution = expectedRuns(lineup, cache)
+        expRuns = 0
+        for i in range(len(scoreDistribution)):
+            expRuns += i * scoreDistribution[i]
+        scores.append(expRuns)
+    return scores
+
+
+def pickCandidate(candidates, reverse, cache=None, screening=False, refine=5):
+    """
+    Picks the best candidate lineup of a step of formBestLineup or formWorstLineup. When the candidates were
+        screened, the top ones are scored again with simulateMarkovChain before picking.
+    :param candidates: [(float, int, int, [Batter])]. The expected runs, best placement, worst placement and lineup
+        of each candidate.
+    :param reverse: bool. True to pick the candidate with the most expected runs, False for the least.
+    :param cache: LineupCache. A cache of run distributions for the candidate lineups, or None.
+    :param screening: bool. Whether the candidates were screened (see scoreCandidates).
+    :param refine: int. The number of top candidates scored again when they were screened.
+    :return: (float, int, int). The expected runs, best placement and worst placement of the picked candidate.
+    """
+    # Sorting is stable, so ties go to the first candidate, in both directions
+    ordered = sorted(candidates, key=lambda c: c[0], reverse=reverse)
+    if screening:
+        top = ordered[:refine]
+        rescored = scoreCandidates([lineup for (expRuns, bestPos, worstPos, lineup) in top], cache)
+        ordered = sorted([(expRuns,) + c[1:] for (expRuns, c) in zip(rescored, top)], key=lambda c: c[0],
+                         reverse=reverse)
+    return ordered[0][:3]
+
+
+def formBestLineup(team, cache=None, screening=False, refine=5):
     """
     Creates a nearly optimal batting order, by assigning the best and worst player to their best possible positions
         when all other players are average, and then the second best and second worst around them, etc... until all
         positions are filled.
-    :param team: The team for which an optimal batting order is needed. Must contain 9 batters.
+    :param team: The team for which an optimal batting order is needed. Must contain at least 9 batters; the 9 with
+        the best ops are used.
+    :param cache: LineupCache. A cache of run distributions for the candidate lineups, or None.
+    :param screening: bool. Whether to screen the candidate lineups with the batched half-inning evaluator, and only
+        score the top ones of each step with simulateMarkovChain.
+    :param refine: int. The number of top candidates scored again at each step when screening.
     :return: [Batter]. A list containing the 9 batters from the given team, in an order that is near-optimal with 
         regards to the expected number of runs scored.
     """
-    players = list(map(lambda Batter: Batter.transitionMatrixSimple(), team.batters))
-    averagePlayer = team.averagePlayer().transitionMatrixSimple()
+    batters = team.starters()
+    averagePlayer = team.averagePlayer(batters)
     availablePositions = set(range(9))
-    bestLineup = [team.averagePlayer()] * 9
+    bestLineup = [averagePlayer] * 9
     for bestRemaining in range(4):
         worstRemaining = 8 - bestRemaining
-        # Expected runs, best placement, worst placement
-        bestPerforming = (0, 0, 0)
+        # Expected runs, best placement, worst placement and lineup of each candidate
+        candidates = []
         for bestPos in availablePositions:
             for worstPos in availablePositions:
                 if bestPos != worstPos:
-                    matrices = [averagePlayer] * 9
-                    matrices[bestPos] = players[bestRemaining]
-                    matrices[worstPos] = players[worstRemaining]
-                    scoreDistribution = simulateMarkovChain(matrices)[:, 216]
-                    expRuns = 0
-                    for i in range(21):
-                        expRuns += i * scoreDistribution[i]
-                    if expRuns > bestPerforming[0]:
-                        bestPerforming = (expRuns, bestPos, worstPos)
+                    candidate = [averagePlayer] * 9
+                    candidate[bestPos] = batters[bestRemaining]
+                    candidate[worstPos] = batters[worstRemaining]
+                    candidates.append((bestPos, worstPos, candidate))
+        scores = scoreCandidates([candidate for (bestPos, worstPos, candidate) in candidates], cache, screening)
+        candidates = [(expRuns,) + candidate for (expRuns, candidate) in zip(scores, candidates)]
+        bestPerforming = pickCandidate(candidates, True, cache, screening, refine)
         availablePositions.remove(bestPerforming[1])
         availablePositions.remove(bestPerforming[2])
-        bestLineup[bestPerforming[1]] = team.batters[bestRemaining]
-        bestLineup[bestPerforming[2]] = team.batters[worstRemaining]
-    bestLineup[availablePositions.pop()] = team.batters[4]
+        bestLineup[bestPerforming[1]] = batters[bestRemaining]
+        bestLineup[bestPerforming[2]] = batters[worstRemaining]
+    bestLineup[availablePositions.pop()] = batters[4]
     return bestLineup
 
 
-def formWorstLineup(team):
+def formWorstLineup(team, cache=None, screening=False, refine=5):
     """
     Creates a nearly optimally worst batting order, by assigning the best and worst player to their best possible positions
         when all other players are average, and then the second best and second worst around them, etc... until all
         positions are filled.
-    :param team: The team for which an optimally worst batting order is needed. Must contain 9 batters.
+    :param team: The team for which an optimally worst batting order is needed. Must contain at least 9 batters; the 9 with
+        the best ops are used.
+    :param cache: LineupCache. A cache of run distributions for the candidate lineups, or None.
+    :param screening: bool. Whether to screen the candidate lineups with the batched half-inning evaluator, and only
+        score the top ones of each step with simulateMarkovChain.
+    :param refine: int. The number of top candidates scored again at each step when screening.
     :return: [Batter]. A list containing the 9 batters from the given team, in an order that is near-optimally worst with 
         regards to the expected number of runs scored.
     """
-    players = list(map(lambda Batter: Batter.transitionMatrixSimple(), team.batters))
-    averagePlayer = team.averagePlayer().transitionMatrixSimple()
+    batters = team.starters()
+    averagePlayer = team.averagePlayer(batters)
     availablePositions = set(range(9))
-    worstLineup = [team.averagePlayer()] * 9
+    worstLineup = [averagePlayer] * 9
     for bestRemaining in range(4):
         worstRemaining = 8 - bestRemaining
-        # Expected runs, best placement, worst placement
-        worstPerforming = (10, 0, 0)
+        # Expected runs, best placement, worst placement and lineup of each candidate
+        candidates = []
         for bestPos in availablePositions:
             for worstPos in availablePositions:
                 if bestPos != worstPos:
-                    matrices = [averagePlayer] * 9
-                    matrices[bestPos] = players[bestRemaining]
-                    matrices[worstPos] = players[worstRemaining]
-                    scoreDistribution = simulateMarkovChain(matrices)[:, 216]
-                    expRuns = 0
-                    for i in range(21):
-                        expRuns += i * scoreDistribution[i]
-                    if expRuns < worstPerforming[0]:
-                        worstPerforming = (expRuns, bestPos, worstPos)
+                    candidate = [averagePlayer] * 9
+                    candidate[bestPos] = batters[bestRemaining]
+                    candidate[worstPos] = batters[worstRemaining]
+                    candidates.append((bestPos, worstPos, candidate))
+        scores = scoreCandidates([candidate for (bestPos, worstPos, candidate) in candidates], cache, screening)
+        candidates = [(expRuns,) + candidate for (expRuns, candidate) in zip(scores, candidates)]
+        worstPerforming = pickCandidate(candidates, False, cache, screening, refine)
         availablePositions.remove(worstPerforming[1])
         availablePositions.remove(worstPerforming[2])
-        worstLineup[worstPerforming[1]] = team.batters[bestRemaining]
-        worstLineup[worstPerforming[2]] = team.batters[worstRemaining]
-    worstLineup[availablePositions.pop()] = team.batters[4]
+        worstLineup[worstPerforming[1]] = batters[bestRemaining]
+        worstLineup[worstPerforming[2]] = batters[worstRemaining]
+    worstLineup[availablePositions.pop()] = batters[4]
     return worstLineup
 
 
@@ -161,32 +278,20 @@ def teamExpectedRuns(teamName, fileName):
     return (u, expRuns)
 
 
-def expectedRemainingRuns(lineup, batterUp, startState):
+def expectedRemainingRuns(lineup, batterUp, startState, precision=None):
     """
     Computes the expected number of runs a team will score from a given point in a game.
     :param lineup: A list of 9 batters
     :param batterUp: An integer in [0, 8], representing whose turn to bat it is in the lineup
     :param startState: The state the game is in
+    :param precision: Keyword arguments of simulateMarkovChain, or None for the default settings
     :return: The expected number of runs the team will score from startState.
     """
-    transitionsMatrices = list(map(lambda Batter: Batter.transitionMatrixSimple(), lineup))
-    u = np.zeros((21, 217))
-    u[0][startState.id] = 1
-    iterations = 0
-    batter = batterUp
-    while sum(u)[216] < 0.999 and iterations < 1000:
-        p = transitionsMatrices[batter]
-        next_u = np.zeros((21, 217))
-        for i in range(21):
-            for j in range(5):
-                if i - j >= 0:
-                    next_u[i] += u[i-j] @ p[j]
-        u = next_u
-        batter = (batter + 1) % 9 
-        iterations += 1
+    kernels = list(map(lambda Batter: Batter.transitionKernel(), lineup))
+    u = simulateMarkovChain(kernels, batterUp, startState.id, **(precision or {}))
     u = u[:, 216]
     expRuns = 0
-    for i in range(21):
+    for i in range(len(u)):
         expRuns += i * u[i]
     return expRuns
 
@@ -244,17 +349,19 @@ if __name__ == "__main__":
         angels = loadData('angels')
         angelsLineup = formBestLineup(angels)
         print('Best lineup found: ' + str(list(map(lambda Batter: Batter.name, angelsLineup))) + '\n')
-        expNo = expectedRemainingRuns(angelsLineup, 1, State(getID(1, 0, 0, 0, 9)))
-        expSucc = expectedRemainingRuns(angelsLineup, 1, State(getID(0, 1, 0, 0, 9)))
-        expFail = expectedRemainingRuns(angelsLineup, 1, State(getID(0, 0, 0, 1, 9)))
+        # A single solve gives the expected remaining runs from every state and batter up
+        angelsChain = AbsorbingChain(angelsLineup)
+        expNo = angelsChain.expectedRemainingRuns(getID(1, 0, 0, 0, 9), 1)
+        expSucc = angelsChain.expectedRemainingRuns(getID(0, 1, 0, 0, 9), 1)
+        expFail = angelsChain.expectedRemainingRuns(getID(0, 0, 0, 1, 9), 1)
         print('With Mike Trout on first base:')
         print('Expected runs without stealing: ' + str(expNo))
         print('Expected runs with a successfull steal: ' + str(expSucc))
         print('Expected runs with a failed steal: ' + str(expFail))
 
-        expNo = expectedRemainingRuns(angelsLineup, 0, State(getID(1, 0, 0, 0, 9)))
-        expSucc = expectedRemainingRuns(angelsLineup, 0, State(getID(0, 1, 0, 0, 9)))
-        expFail = expectedRemainingRuns(angelsLineup, 0, State(getID(0, 0, 0, 1, 9)))
+        expNo = angelsChain.expectedRemainingRuns(getID(1, 0, 0, 0, 9), 0)
+        expSucc = angelsChain.expectedRemainingRuns(getID(0, 1, 0, 0, 9), 0)
+        expFail = angelsChain.expectedRemainingRuns(getID(0, 0, 0, 1, 9), 0)
         print('With Kole Calhoun on first base:')
         print('Expected runs without stealing: ' + str(expNo))
         print('Expected runs with a successfull steal: ' + str(expSucc))
@@ -1,64 +1,68 @@
 import csv
-from baseballPlayer import Player
+import os
+import numpy as np
+from baseballPlayer import Player, statFields, rateMatrix
+from baseballKernel import kernelFromRates
 
 
 class Team:
     """
-    Represents a Baseball team, through the pitchers and batters in the team.
+    Represents a Baseball team, through the pitchers and batters in the team. The batters are views into the team's
+    stats and rates matrices, with one row per batter.
     """
 
     def __init__(self, teamName, batters, pitchers):
         """
         :param teamName: String. The team's name
-        :param batters: [Batter]. A list containing the 9 batters in the team.
+        :param batters: [Batter]. A list containing the batters in the team (9, or more with a bench).
         :param teamName: []. A list containing the pitchers in the team (ignored for now)
         """
         self.name = teamName
-        self.batters = sorted(batters, key=lambda Player: Player.ops)
+        stats = np.array([b.stats[b.row] for b in batters]).reshape(len(batters), len(statFields))
+        # Sorting is stable, so batters with the same ops stay in the given order
+        order = np.argsort(stats[:, statFields.index('ops')], kind='stable')
+        self.stats = stats[order]
+        self.rates = rateMatrix(self.stats)
+        self.batters = [Player.view(batters[i].id, batters[i].name, self.stats, self.rates, row)
+                        for (row, i) in enumerate(order)]
         self.pitchers = pitchers
 
-    def averagePlayer(self):
+    def averagePlayer(self, batters=None):
         """
         Computes an average player for the team.
+        :param batters: [Batter]. The batters averaged, e.g. self.starters(), or None for every batter in self.
         :return: Batter. An average batter in self.
         """
-        pa = 0
-        outs = 0
-        b1 = 0
-        b2 = 0
-        b3 = 0
-        b4 = 0
-        bb = 0
-        ops = 0
-        for b in self.batters:
-            pa += b.pa
-            outs += b.outs
-            b1 += b.b1
-            b2 += b.b2
-            b3 += b.b3
-            b4 += b.b4
-            bb += b.bb
-            ops += b.ops
-        pa /= 9
-        outs /= 9
-        b1 /= 9
-        b2 /= 9
-        b3 /= 9
-        b4 /= 9
-        bb /= 9
-        ops /= 9
+        stats = self.stats if batters is None else np.array([b.stats[b.row] for b in batters])
+        (pa, b1, b2, b3, b4, bb, outs, ops) = stats.reshape(-1, len(statFields)).mean(axis=0)
         return Player(0, self.name, pa, b1, b2, b3, b4, bb, ops)
-    
 
-def loadData(team):
+    def starters(self, size=9):
+        """
+        :param size: int. The number of batters in a lineup.
+        :return: [Batter]. The batters with the best ops, sorted by ops like self.batters.
+        """
+        if len(self.batters) < size:
+            raise ValueError(self.name + ' has ' + str(len(self.batters)) + ' batters, ' + str(size) + ' are needed.')
+        return self.batters[len(self.batters) - size:]
+
+    def transitionKernels(self, model=None):
+        """
+        :param model: EventModel. The event model, or None for the six events of baseballMC.State.
+        :return: [TransitionKernel]. The transition kernel of each batter, in the order of self.batters.
+        """
+        return list(map(lambda rates: kernelFromRates(tuple(rates), model), self.rates.tolist()))
+
+
+def readRows(path):
     """
-    Loads team data from a csv file that contains 9 batters.
-    :param team: the name of the csv file.
-    :return: Team. The team contained in the given csv file.
+    Reads the batters of a FanGraphs csv file.
+    :param path: string. The path of the csv file.
+    :return: [(string, string, int, int, int, int, int, int, float)]. For each batter, the arguments of Player.
     """
-    with open('TeamData/AL/' + team + '.csv', newline='') as csvfile:
+    with open(path, newline='') as csvfile:
         datareader = csv.DictReader(csvfile)
-        batters = []
+        rows = []
         # For each batter, extract the information\n",
         for row in datareader:
             playerID = row['playerid']
@@ -70,6 +74,16 @@ def loadData(team):
             bb = int(row['BB']) + int(row['IBB']) + int(row['HBP'])
             pa = int(row['AB']) + bb
             ops = float(row['OPS'])
-            batters.append(Player(playerID, name, pa, b1, b2, b3, b4, bb, ops))
-    return Team(team, batters, [])
+            rows.append((playerID, name, pa, b1, b2, b3, b4, bb, ops))
+    return rows
+
 
+def loadData(team, directory='TeamData/AL/'):
+    """
+    Loads team data from a csv file that contains 9 batters.
+    :param team: the name of the csv file.
+    :param directory: the directory containing the csv file.
+    :return: Team. The team contained in the given csv file.
+    """
+    batters = [Player(*row) for row in readRows(os.path.join(directory, team + '.csv'))]
+    return Team(team, batters, [])
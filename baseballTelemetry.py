@@ -0,0 +1,168 @@
+"""
+Telemetry for the solvers of the baseball MC.
+
+The solvers report what they do (iterations and convergence of each chain simulation, mass truncated beyond the
+largest number of runs tracked, kernel builds, time spent in each phase) to the SolverMetrics objects collected
+through collect(). Nothing is recorded, and no extra work is done, when no metrics are being collected.
+
+    with collect() as metrics:
+        formBestLineup(team)
+    print(metrics.toDict())
+"""
+import contextlib
+import time
+
+
+# The metrics currently collecting, innermost last
+_active = []
+
+
+class SolverMetrics:
+    """
+    Aggregated telemetry of the solver calls made while collecting.
+    """
+    def __init__(self, callbacks=(), traceSteps=False):
+        """
+        :param callbacks: [function]. Functions called as callback(event, data) for every 'step', 'call' and
+            'kernelBuild' event, where data is a dict describing the event.
+        :param traceSteps: bool. Whether to keep the residual mass of every step of every call in self.calls.
+        """
+        self.callbacks = list(callbacks)
+        self.traceSteps = traceSteps
+        self.chainCalls = 0
+        self.iterations = 0
+        self.iterationCapHits = 0
+        self.truncatedMass = 0
+        self.maxTruncatedMass = 0
+        self.kernelBuilds = 0
+        self.phaseSeconds = {}
+        self.phaseCalls = {}
+        self.calls = []
+
+    def onStep(self, iteration, absorbed, truncated):
+        """
+        Records one step of a chain simulation.
+        :param iteration: int. The number of plate appearances simulated so far in the call.
+        :param absorbed: float. The probability that the game is over.
+        :param truncated: float. The probability dropped because more than the largest number of runs tracked scored.
+        """
+        data = {'iteration': iteration, 'absorbed': absorbed, 'truncated': truncated,
+                'residual': 1 - absorbed - truncated}
+        if self.traceSteps:
+            if not self.calls or 'done' in self.calls[-1]:
+                self.calls.append({'steps': []})
+            self.calls[-1]['steps'].append(data['residual'])
+        for callback in self.callbacks:
+            callback('step', data)
+
+    def onCall(self, iterations, absorbed, truncated, converged):
+        """
+        Records the end of a chain simulation.
+        :param iterations: int. The number of plate appearances simulated.
+        :param absorbed: float. The probability that the game is over.
+        :param truncated: float. The probability dropped because more than the largest number of runs tracked scored.
+        :param converged: bool. Whether the simulation stopped because enough games were over (or hit the
+            iteration cap).
+        """
+        self.chainCalls += 1
+        self.iterations += iterations
+        self.iterationCapHits += 0 if converged else 1
+        self.truncatedMass += truncated
+        self.maxTruncatedMass = max(self.maxTruncatedMass, truncated)
+        data = {'iterations': iterations, 'absorbed': absorbed, 'truncated': truncated, 'converged': converged}
+        if self.traceSteps:
+            if not self.calls or 'done' in self.calls[-1]:
+                self.calls.append({'steps': []})
+            self.calls[-1].update(data)
+            self.calls[-1]['done'] = True
+        for callback in self.callbacks:
+            callback('call', data)
+
+    def onKernelBuild(self):
+        """
+        Records that a transition kernel was built (rather than found in the kernel cache).
+        """
+        self.kernelBuilds += 1
+        for callback in self.callbacks:
+            callback('kernelBuild', {})
+
+    def onPhase(self, name, seconds):
+        """
+        Records time spent in a phase of a computation.
+        :param name: string. The name of the phase.
+        :param seconds: float. The time spent in the phase.
+        """
+        self.phaseSeconds[name] = self.phaseSeconds.get(name, 0) + seconds
+        self.phaseCalls[name] = self.phaseCalls.get(name, 0) + 1
+
+    def merge(self, other):
+        """
+        Adds the telemetry of other to these metrics (e.g. to aggregate the metrics of several workers).
+        :param other: SolverMetrics or dict. The metrics to add, or the result of their toDict().
+        """
+        if isinstance(other, SolverMetrics):
+            other = other.toDict()
+        self.chainCalls += other['chainCalls']
+        self.iterations += other['iterations']
+        self.iterationCapHits += other['iterationCapHits']
+        self.truncatedMass += other['truncatedMass']
+        self.maxTruncatedMass = max(self.maxTruncatedMass, other['maxTruncatedMass'])
+        self.kernelBuilds += other['kernelBuilds']
+        for (name, seconds) in other['phaseSeconds'].items():
+            self.phaseSeconds[name] = self.phaseSeconds.get(name, 0) + seconds
+            self.phaseCalls[name] = self.phaseCalls.get(name, 0) + other['phaseCalls'][name]
+
+    def toDict(self):
+        """
+        :return: dict. The aggregated metrics, as plain (JSON serializable) values.
+        """
+        return {
+            'chainCalls': self.chainCalls,
+            'iterations': self.iterations,
+            'iterationCapHits': self.iterationCapHits,
+            'truncatedMass': float(self.truncatedMass),
+            'maxTruncatedMass': float(self.maxTruncatedMass),
+            'kernelBuilds': self.kernelBuilds,
+            'phaseSeconds': dict(self.phaseSeconds),
+            'phaseCalls': dict(self.phaseCalls),
+        }
+
+
+def active():
+    """
+    :return: [SolverMetrics]. The metrics currently collecting (empty when telemetry is off).
+    """
+    return _active
+
+
+@contextlib.contextmanager
+def collect(metrics=None):
+    """
+    Collects the telemetry of the solvers while the context is active. Contexts can be nested, in which case every
+    active metrics object records the events.
+    :param metrics: SolverMetrics. The metrics to record to (a new one by default).
+    """
+    metrics = SolverMetrics() if metrics is None else metrics
+    _active.append(metrics)
+    try:
+        yield metrics
+    finally:
+        _active.remove(metrics)
+
+
+@contextlib.contextmanager
+def phase(name):
+    """
+    Times the enclosed code as phase name, in every active metrics object.
+    :param name: string. The name of the phase.
+    """
+    if not _active:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        for metrics in _active:
+            metrics.onPhase(name, seconds)
@@ -0,0 +1,89 @@
+"""
+What-if analysis of single-player substitutions, for trades and free agent screening.
+
+The base lineup is formed once, and every substitution puts the new player in the slot of the batter they replace,
+so candidates differ from the base lineup in a single row of its (9, 6) rate matrix. The expected runs of all the
+candidates are evaluated together with the batched half-inning evaluator, and win probabilities (optional) with the
+inning engine, reusing the memoized kernels of the unchanged batters.
+"""
+import os
+import numpy as np
+from baseballTeam import loadData
+from baseballInnings import InningEngine
+from baseballLineupSearch import expectedRunsBatch
+from baseballWinProbability import gameWinProbability
+from baseballSimulator import teamsAL, formBestLineup
+
+
+def loadPlayerPool(directory='TeamData/AL/', teams=None):
+    """
+    Loads the batters of several teams as a pool of players available for substitutions.
+    :param directory: string. The directory containing the teams' csv files.
+    :param teams: [string]. The names of the csv files, or None for every csv file in the directory.
+    :return: [Batter]. The batters of all the teams.
+    """
+    if teams is None:
+        teams = sorted(os.path.splitext(f)[0] for f in os.listdir(directory) if f.endswith('.csv'))
+    pool = []
+    for team in teams:
+        pool.extend(loadData(team, directory).batters)
+    return pool
+
+
+def whatIf(team, substitutions, opponent=None, lineup=None, winProbabilities=True):
+    """
+    Scores substitutions in a team's lineup. The expected runs of all the substitutions are evaluated together, but
+    each win probability solves the inning engine of its candidate lineup (about 45 ms): with winProbabilities, this
+    is intended for short lists of substitutions, and long screens should rank by expected runs first.
+    :param team: Team. The base team.
+    :param substitutions: [(Batter, Batter)]. For each substitution, the batter replaced (matched by player id) and
+        the player replacing them.
+    :param opponent: Team. The team the win probabilities are computed against (the base team by default).
+    :param lineup: [Batter]. The base lineup of the team (formBestLineup(team) by default).
+    :param winProbabilities: bool. Whether to compute the win probabilities, or only the expected runs.
+    :return: [dict]. One row per substitution, sorted by decreasing run delta, with the replaced and new players,
+        the slot, the expected runs and their delta from the base lineup, and the win probability (as the home team)
+        and its delta.
+    """
+    lineup = lineup if lineup is not None else formBestLineup(team)
+    ids = list(map(lambda Batter: Batter.id, lineup))
+    slots = []
+    for (out, player) in substitutions:
+        if ids.count(out.id) != 1:
+            raise ValueError(out.name + ' (' + str(out.id) + ') is ' + ('not in' if out.id not in ids else
+                             'in more than one slot of') + ' the lineup of ' + team.name + '.')
+        slots.append(ids.index(out.id))
+    baseRates = np.array(list(map(lambda Batter: Batter.rates(), lineup)))
+    # Every candidate is the base lineup with one row of rates replaced
+    rates = np.repeat(baseRates[None], len(substitutions) + 1, axis=0)
+    for (i, (out, player)) in enumerate(substitutions):
+        rates[i + 1, slots[i]] = player.rates()
+    runs = expectedRunsBatch(rates)
+
+    if winProbabilities:
+        baseEngine = InningEngine(lineup)
+        opponentEngine = InningEngine(formBestLineup(opponent)) if opponent is not None else baseEngine
+        baseWin = gameWinProbability(baseEngine, opponentEngine)
+    rows = []
+    for (i, (out, player)) in enumerate(substitutions):
+        row = {'out': out.name, 'in': player.name, 'slot': slots[i],
+               'expectedRuns': runs[i + 1], 'runDelta': runs[i + 1] - runs[0]}
+        if winProbabilities:
+            candidate = list(lineup)
+            candidate[slots[i]] = player
+            row['winProbability'] = gameWinProbability(InningEngine(candidate), opponentEngine)
+            row['winDelta'] = row['winProbability'] - baseWin
+        rows.append(row)
+    return sorted(rows, key=lambda row: -row['runDelta'])
+
+
+if __name__ == "__main__":
+    # Screening every batter of the league as a replacement for each Red Sox batter
+    redsox = loadData('redsox')
+    pool = loadPlayerPool(teams=teamsAL)
+    ids = set(map(lambda Batter: Batter.id, redsox.batters))
+    substitutions = [(batter, player) for batter in redsox.batters for player in pool if player.id not in ids]
+    rows = whatIf(redsox, substitutions, winProbabilities=False)
+    print('Best substitutions for the Boston Red Sox:')
+    for row in rows[:10]:
+        print(row['in'] + ' for ' + row['out'] + ': ' + str(round(row['runDelta'], 3)) + ' runs per game')